@@ -3,15 +3,61 @@ import sys
 import os
 import logging
 import logging.config
+import json
+import hashlib
+import time
+import argparse
 logging.getLogger('asyncio').setLevel(logging.WARNING)
 logger = logging.getLogger()
-from prompt_toolkit import prompt
-from prompt_toolkit.styles import Style
-from prompt_toolkit.styles.named_colors import NAMED_COLORS
-from copy import deepcopy
 
-import ruamel.yaml
-yaml = ruamel.yaml.YAML()
+# prompt_toolkit and ruamel.yaml are imported when needed - ruamel.yaml
+# only when cfg.yaml has changed since it was last loaded
+
+def prompt(message):
+    from prompt_toolkit import prompt
+    return prompt(message)
+
+
+def cfg_cache_path(cfg_path):
+    return os.path.join(os.path.dirname(cfg_path), 'cfg.cache.json')
+
+
+def cfg_key(cfg_path, defaults):
+    """
+    Return the key identifying the contents of cfg_path, by its
+    modification time, size and inode, and the default settings.
+    """
+    st = os.stat(cfg_path)
+    return [st.st_mtime_ns, st.st_size, st.st_ino,
+            hashlib.sha1(defaults.encode('utf-8')).hexdigest()]
+
+
+def load_cfg_cache(cfg_path, defaults):
+    """
+    Return the settings saved by save_cfg_cache if cfg_path and the
+    defaults are unchanged since, otherwise None.
+    """
+    try:
+        with open(cfg_cache_path(cfg_path), 'r', encoding='utf-8') as fo:
+            cache = json.load(fo)
+        if cache.get('key') == cfg_key(cfg_path, defaults):
+            return cache['settings']
+    except (OSError, ValueError, AttributeError, KeyError):
+        pass
+    return None
+
+
+def save_cfg_cache(cfg_path, defaults, settings):
+    """
+    Save the settings loaded from cfg_path after it has been merged with
+    the defaults so that the next start can skip loading it with ruamel.
+    """
+    try:
+        key = cfg_key(cfg_path, defaults)
+        with open(cfg_cache_path(cfg_path), 'w', encoding='utf-8') as fo:
+            json.dump({'key': key, 'settings': settings}, fo)
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning(f"could not save the settings cache: {e}")
 
 # for cfg.yaml
 
@@ -66,10 +112,44 @@ tag_sort:
     assigned:   '%'
     someday:    '&'
     completed:  '('
+# SCAN
+# scan_workers: the number of worker threads used to list, stat and
+# read the note files, which can help when they are on a slow or
+# network file system. Use 0 to scan the files one after another.
+scan_workers: 0
+# BACKEND
+# backend: either 'memory' to keep the parsed notes in memory or
+# 'sqlite' to keep the note bodies in a SQLite database, notes.db, in
+# the nts home directory and use it for find and join queries. The
+# sqlite backend uses less memory with very large collections of notes.
+backend: memory
+# body_cache: with the memory backend, 0 to keep the bodies of all
+# notes in memory. Otherwise only the titles, tags and locations of
+# notes are kept in memory and find reads the bodies from the note
+# files, keeping at most this many megabytes of bodies in a cache. Each
+# find reads the files with notes that are not in the cache once. This
+# uses much less memory but find is slower.
+body_cache: 0
+# WATCH
+# watch: true to refresh the session view automatically when note files
+# are changed, added or removed - using inotify on Linux and otherwise by
+# checking the files every second. With false, press 'r' to refresh.
+watch: false
 # STYLE
 # color settings for session mode
 """
 
+    # the merge below only changes cfg.yaml when settings are missing or
+    # invalid, so an unchanged cfg.yaml can be used as it was last loaded
+    if os.path.isfile(cfg_path):
+        settings = load_cfg_cache(cfg_path, default_template + dark + light)
+        if settings is not None:
+            return settings
+
+    import ruamel.yaml
+    from copy import deepcopy
+    yaml = ruamel.yaml.YAML()
+
     if os.path.isfile(cfg_path):
         has_cfg = True
         with open(cfg_path, 'r') as fn:
@@ -142,6 +222,7 @@ Use color settings for a d)ark or l)ight terminal background? [Dl] > """)
     with open(cfg_path, 'r') as fo:
         yaml_data = yaml.load(fo)
 
+    save_cfg_cache(cfg_path, default_template + dark + light, yaml_data)
     return yaml_data
 
 
@@ -258,6 +339,29 @@ def setup_logging(level, ntsdir, file=None):
 
 
 def main():
+    started = time.perf_counter()
+    # --profile, --timings and --memory cover the whole run including the
+    # scan made before nts.main parses the arguments
+    pre_parser = argparse.ArgumentParser(add_help=False)
+    pre_parser.add_argument("--profile")
+    pre_parser.add_argument("--timings", action="store_true")
+    pre_parser.add_argument("--memory", action="store_true")
+    pre_args, remaining = pre_parser.parse_known_args()
+    profiler = None
+    if pre_args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        run(started, pre_args.timings, pre_args.memory)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(pre_args.profile)
+            print(f"profile saved to '{pre_args.profile}'", file=sys.stderr)
+
+
+def run(started, timings=False, memory=False):
     import nts
     import nts.__version__ as version
     nts_version = version.version
@@ -313,16 +417,26 @@ def main():
             logger.info("added example data")
 
     cfg_path = os.path.join(ntshome, 'cfg.yaml')
+    cache_path = os.path.join(ntshome, 'cache.pickle')
 
     import nts.nts as nts
     nts.logger = logger
-    Data = nts.NodeData(rootdir)
-    nts.Data = Data
     nts.nts_version = nts_version
+    if timings:
+        nts.timings = {}
     nts.get_yaml_data = get_yaml_data
     nts.cfg_path = cfg_path
 
     yaml_data = get_yaml_data(cfg_path)
+    scan_workers = yaml_data.get('scan_workers', 0) if yaml_data else 0
+    # megabytes -> bytes
+    body_cache = int(yaml_data.get('body_cache') or 0) * 2**20 if yaml_data else 0
+    store = None
+    if yaml_data and yaml_data.get('backend') == 'sqlite':
+        from nts.store import NoteStore
+        store = NoteStore(os.path.join(ntshome, 'notes.db'), nts.fold)
+        # the store replaces the parse cache
+        cache_path = None
     if yaml_data:
         session_edit = f"{yaml_data['edit_command']} {yaml_data['session_edit_args']}"
         nts.session_edit = session_edit
@@ -332,10 +446,24 @@ def main():
         nts.command_edit = command_edit
         command_add = f"{yaml_data['edit_command']} {yaml_data['command_add_args']}"
         nts.command_add = command_add
-        user_style = yaml_data['style']
-        style_obj = Style.from_dict(user_style)
-        nts.style_obj = style_obj
+        # the Style is created by nts.get_style when first needed
+        nts.user_style = yaml_data['style']
         tag_sort = yaml_data.get('tag_sort', {})
         nts.tag_sort = tag_sort
-
-    nts.main()
\ No newline at end of file
+        nts.watch_files = yaml_data.get('watch', False)
+    if memory:
+        import tracemalloc
+        tracemalloc.start()
+    # tag_sort is needed to order the tag nodes
+    Data = nts.NodeData(rootdir, cache_path, scan_workers, store, body_cache)
+    nts.Data = Data
+    if memory:
+        nts.scan_memory = tracemalloc.get_traced_memory()
+
+    try:
+        nts.main()
+    finally:
+        if timings:
+            lines = nts.timings_lines(time.perf_counter() - started)
+            logger.info("timings:\n    " + "\n    ".join(lines))
+            print("\n".join(lines), file=sys.stderr)
\ No newline at end of file
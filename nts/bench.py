@@ -0,0 +1,762 @@
+"""
+Benchmarks for nts. Run
+
+    python -m nts.bench imports [--runs N] [--target MS]
+
+to time, in fresh interpreters, the imports needed by the command line
+interface. The time is the median over the runs of the time to start
+python and import nts.__main__ and nts.nts less the time to start python
+alone. The exit status is 1 if it exceeds the target or if one of the
+modules that should only be imported when needed has been imported.
+
+    python -m nts.bench corpus DIR [corpus options]
+
+writes a reproducible synthetic data directory, DIR/data, with the
+shape given by the options and records the options and counts in
+DIR/corpus.json.
+
+    python -m nts.bench run [--data DIR] [corpus options] [--output FILE] [--compare FILE]
+
+times the NodeData operations on DIR/data, generating it first if
+needed or, without --data, in a temporary directory. The results, with
+the time, throughput and peak traced memory of each operation, are
+printed and, with --output, saved as JSON. Unless --no-memory is given,
+the memory used by the scan and by each of the main structures, as for
+the --memory option of nts, is also reported and saved. With --compare,
+the times and this memory are also compared with those in the results
+saved for another revision.
+
+    python -m nts.bench session [--data DIR] [corpus options] [--rounds N] [--script FILE]
+
+runs the interactive session on DIR/data, as for run, with input from a
+pipe and output to a dummy terminal. It types the commands of a script
+round after round and reports the percentiles of the latency of each
+command, the time from sending its keys until the display has been
+redrawn. --output and --compare are as for run.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import shutil
+import threading
+import tracemalloc
+import math
+
+# the import time target in milliseconds for the command line interface
+import_target = 100
+
+# modules that the command line interface should not import
+lazy_modules = ['prompt_toolkit', 'ruamel', 'requests', 'pyperclip',
+        'concurrent.futures.process', 'ctypes', 'sqlite3']
+
+import_code = """\
+import sys
+import nts.__main__, nts.nts
+print(' '.join(sorted(x for x in sys.modules if x.split('.')[0] in {lazy})))
+"""
+
+# the defaults for the shape of the synthetic corpus
+corpus_defaults = {
+        'depth': 3,     # levels of directories below data
+        'fanout': 4,    # subdirectories of each directory above the last level
+        'files': 3,     # note files in each directory
+        'notes': 20,    # notes in each file
+        'tags': 200,    # tags in the vocabulary
+        'body': 8,      # at most this many body lines for each note
+        'seed': 1,
+        }
+
+# the number of distinct body lines to draw from
+line_pool_size = 4096
+
+# the number of ids used for showID and of notes used for showNotes
+sample_size = 200
+
+# the session script: (name, keys) with the keys as typed in a terminal
+# and {word}, {tag}, {dir} and {id} replaced by a word from a note title,
+# the most frequent tag, the name of a directory and the id of a note in
+# the path view. Commands with the same name are reported together.
+session_script = [
+        ['p', 'p'],
+        ['t', 't'],
+        ['p', 'p'],
+        ['l', 'l'],
+        ['l', 'l'],
+        ['b', 'b'],
+        ['b', 'b'],
+        ['r', 'r'],
+        ['h', 'h'],
+        ['p', 'p'],
+        ['down', '\x0e'],              # control-n
+        ['pagedown', '\x1b[6~'],
+        ['m', 'm2\r'],
+        ['m', 'm0\r'],
+        ['g', 'g{dir}\r'],
+        ['g', 'g\r'],
+        ['j', 'j{tag}\r'],
+        ['j', 'j\r'],
+        # control-e and control-u clear the ident from the current line
+        ['i', 'i\x05\x15{id}\r'],
+        ['i', 'i\x05\x15' '0\r'],
+        ['f', 'f{word}\r'],
+        ['/', '/{word}\r'],
+        ['..', '..'],
+        [',,', ',,'],
+        ['s', 's'],
+        ]
+
+# seconds to wait for a command to be handled and shown
+session_timeout = 60
+
+syllables = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'te', 'vi', 'do', 'pa',
+        'gri', 'sto', 'ble', 'an', 'or', 'el', 'un', 'is', 'ex', 'qua']
+
+
+def run_python(code):
+    """
+    Return the time taken to run code in a fresh interpreter and its
+    output.
+    """
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join([root] + [x for x in [env.get('PYTHONPATH')] if x])
+    start = time.perf_counter()
+    res = subprocess.run([sys.executable, '-c', code], env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+    return time.perf_counter() - start, res.stdout
+
+
+def time_imports(runs=7):
+    """
+    Return the median import time in milliseconds and the lazy modules,
+    top-level or as listed, that were imported.
+    """
+    code = import_code.format(lazy=set(x.split('.')[0] for x in lazy_modules))
+    bare = []
+    full = []
+    imported = ""
+    for i in range(runs):
+        bare.append(run_python("pass")[0])
+        seconds, imported = run_python(code)
+        full.append(seconds)
+    ms = 1000 * (statistics.median(full) - statistics.median(bare))
+    imported = imported.split()
+    found = [x for x in lazy_modules if x in imported]
+    return ms, found
+
+
+def make_corpus(outdir, depth=3, fanout=4, files=3, notes=20, tags=200, body=8, seed=1):
+    """
+    Write a synthetic data directory, outdir/data, in which every
+    directory down to depth has files note files with notes notes each.
+    Tags are drawn from a vocabulary of tags tags with the earlier ones
+    more common, as are real tags, and bodies have up to body lines.
+    The same arguments always give the same files. Return the options
+    and counts that are also saved in outdir/corpus.json.
+    """
+    rnd = random.Random(seed)
+    words = sorted(set(
+            "".join(rnd.choice(syllables) for i in range(rnd.randint(1, 4)))
+            for j in range(2000)))
+    vocabulary = [f"{rnd.choice(words)}{i}" for i in range(tags)]
+    # roughly Zipf distributed
+    weights = [1 / (i + 1) for i in range(tags)]
+    pool = [
+            " ".join(rnd.choice(words) for i in range(rnd.randint(4, 14)))
+            for j in range(line_pool_size)]
+
+    rootdir = os.path.join(outdir, 'data')
+    if os.path.isdir(rootdir):
+        shutil.rmtree(rootdir)
+    counts = {'directories': 0, 'files': 0, 'notes': 0, 'bytes': 0}
+
+    def write_dir(path, level):
+        os.makedirs(path)
+        counts['directories'] += 1
+        for f in range(files):
+            chunks = []
+            for n in range(notes):
+                title = " ".join(rnd.choice(words) for i in range(rnd.randint(2, 6)))
+                notetags = set(rnd.choices(vocabulary, weights, k=rnd.randint(0, 3))) if tags else ()
+                tagstr = f" ({', '.join(sorted(notetags))})" if notetags else ""
+                chunks.append(f"+ {title} {counts['notes']}{tagstr}\n")
+                for i in range(rnd.randint(0, body)):
+                    chunks.append(f"    {rnd.choice(pool)}\n")
+                chunks.append("\n")
+                counts['notes'] += 1
+            text = "".join(chunks)
+            with open(os.path.join(path, f"notes{f:03d}.txt"), 'w') as fo:
+                fo.write(text)
+            counts['files'] += 1
+            counts['bytes'] += len(text)
+        if level < depth:
+            for d in range(fanout):
+                write_dir(os.path.join(path, f"{rnd.choice(words)}{d:03d}"), level + 1)
+
+    write_dir(rootdir, 0)
+    info = {
+            'options': {'depth': depth, 'fanout': fanout, 'files': files,
+                'notes': notes, 'tags': tags, 'body': body, 'seed': seed},
+            'counts': counts,
+            }
+    with open(os.path.join(outdir, 'corpus.json'), 'w') as fo:
+        json.dump(info, fo, indent=2)
+    return info
+
+
+def measure(func, repeat=3, memory=True, setup=None):
+    """
+    Return the times in seconds of repeat calls of func, each preceded
+    by a call of setup if given, and, if memory, the peak memory in bytes
+    traced during another call.
+    """
+    times = []
+    for i in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    peak = None
+    if memory:
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return times, peak
+
+
+def run_benchmarks(rootdir, repeat=3, memory=True, workers=0, report=print):
+    """
+    Time the NodeData operations on the notes in rootdir. Return name ->
+    {'seconds', 'min', 'runs', 'items', 'per_second', 'peak_bytes'}
+    where items is the number of notes processed or, for showID and
+    showNotes, the number of calls in each run.
+    """
+    # fixed terminal dimensions for the tree and note displays
+    os.environ['COLUMNS'] = '100'
+    os.environ['LINES'] = '40'
+    import nts.nts as nts
+
+    results = {}
+
+    def record(name, times, peak, items):
+        seconds = statistics.median(times)
+        results[name] = {
+                'seconds': seconds,
+                'min': min(times),
+                'runs': times,
+                'items': items,
+                'per_second': items / seconds if seconds else None,
+                'peak_bytes': peak,
+                }
+        report(format_result(name, results[name]))
+
+    holder = []
+    times, peak = measure(lambda: holder.append(nts.NodeData(rootdir, workers=workers)),
+            repeat, memory, setup=holder.clear)
+    Data = holder[-1]
+    Data.sessionMode = True
+    numnotes = sum(1 for x in Data.notes if x is not None)
+    record('getNodes (initial scan)', times, peak, numnotes)
+
+    times, peak = measure(Data.getNodes, repeat, memory)
+    record('getNodes (unchanged)', times, peak, numnotes)
+
+    filepath = sorted(Data.filekeys)[len(Data.filekeys) // 2]
+
+    def touch():
+        st = os.stat(filepath)
+        os.utime(filepath, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+
+    times, peak = measure(Data.getNodes, repeat, memory, setup=touch)
+    record('getNodes (one file changed)', times, peak, numnotes)
+
+    def fresh_view():
+        Data.views.clear()
+        Data.nodeskey = None
+        Data.findkey = None
+        Data.wraps.clear()
+
+    for mode in ['path', 'tags']:
+        Data.setMode(mode)
+        times, peak = measure(Data.showNodes, repeat, memory, setup=fresh_view)
+        record(f'showNodes ({mode})', times, peak, numnotes)
+        times, peak = measure(Data.showNodes, repeat, memory)
+        record(f'showNodes ({mode}, unchanged)', times, peak, numnotes)
+
+    Data.setMode('path')
+    Data.showNodes()
+    # a word from a title, part of it, a regex and a string without matches
+    note = next(x for x in Data.notes if x is not None)
+    word = note.title.split()[0]
+    for label, find in [('word', word), ('fragment', word[1:4]),
+            ('regex', f"^ +{word[:2]}\\w* {word[:1]}"), ('no match', 'zzqzz')]:
+        def run_find(find=find):
+            Data.find(find)
+        times, peak = measure(run_find, repeat, memory, setup=fresh_view)
+        record(f'find ({label})', times, peak, numnotes)
+
+    # the most and least frequent tags
+    tags = sorted([x for x in Data.taghash if x != '~'], key=lambda x: -len(Data.taghash[x]))
+    common = tags[0] if tags else 'zzqzz'
+    second = tags[1] if len(tags) > 1 else common
+    rare = tags[-1] if tags else 'zzqzz'
+    for label, join in [('common tag', common), ('rare tag', rare),
+            ('or', f"| {common}, {rare}"), ('and', f"& {common}, {second}")]:
+        def run_join(join=join):
+            Data.setJoin(join)
+            Data.showNodes()
+        times, peak = measure(run_join, repeat, memory, setup=fresh_view)
+        record(f'setJoin ({label})', times, peak, numnotes)
+    Data.setJoin('')
+
+    dirname = next(iter(sorted(Data.dirkeys - {'.'})), '.')
+    for label, get in [('directory', os.path.basename(dirname)), ('no match', 'zzqzz')]:
+        def run_get(get=get):
+            Data.setGet(get)
+            Data.showNodes()
+        times, peak = measure(run_get, repeat, memory, setup=fresh_view)
+        record(f'setGet ({label})', times, peak, numnotes)
+    Data.setGet('')
+    Data.showNodes()
+
+    ids = sorted(Data.id2info)
+    idstrs = ['-'.join(str(x) for x in idtup)
+            for idtup in ids[::max(1, len(ids) // sample_size)][:sample_size]]
+
+    def show_ids():
+        for idstr in idstrs:
+            Data.setStart('.')
+            Data.showID(idstr)
+        Data.setStart('.')
+        Data.showNodes()
+
+    times, peak = measure(show_ids, repeat, memory, setup=fresh_view)
+    record('showID', times, peak, len(idstrs))
+
+    keys = [x.key for x in Data.notes if x is not None]
+    keys = keys[::max(1, len(keys) // sample_size)][:sample_size]
+
+    def show_notes():
+        for filepath, linenum in keys:
+            Data.showNotes(filepath, linenum)
+
+    times, peak = measure(show_notes, repeat, memory, setup=fresh_view)
+    record('showNotes', times, peak, len(keys))
+    times, peak = measure(show_notes, repeat, memory)
+    record('showNotes (wrapped)', times, peak, len(keys))
+
+    return results
+
+
+def memory_footprint(rootdir, workers=0):
+    """
+    Return {'notes', 'scan_bytes', 'scan_peak_bytes', 'structures'} for a
+    scan of the notes in rootdir traced by tracemalloc, where structures
+    is structure -> bytes from nts.memory_usage.
+    """
+    import nts.nts as nts
+
+    tracemalloc.start()
+    try:
+        Data = nts.NodeData(rootdir, workers=workers)
+        scan = tracemalloc.get_traced_memory()
+        numnotes = len(Data.notes) - len(Data.freeids)
+        usage = nts.memory_usage(Data)
+    finally:
+        tracemalloc.stop()
+    return {
+            'notes': numnotes,
+            'scan_bytes': scan[0],
+            'scan_peak_bytes': scan[1],
+            'structures': dict(usage),
+            }
+
+
+def percentile(values, p):
+    """
+    Return the p'th percentile of values using the nearest rank.
+    """
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def count_keys(keys):
+    """
+    Return the number of key presses in keys as parsed by prompt_toolkit.
+    """
+    from prompt_toolkit.input.vt100_parser import Vt100Parser
+    presses = []
+    parser = Vt100Parser(presses.append)
+    parser.feed(keys)
+    parser.flush()
+    return len(presses)
+
+
+class SessionDriver(object):
+    """
+    Type the commands of a script into a running session from another
+    thread and time them. The time of a command is from sending its keys
+    until the first redraw after the last of them has been handled.
+    """
+
+    def __init__(self, pipe, app_session, commands, rounds, warmup):
+        self.pipe = pipe
+        self.app_session = app_session
+        self.commands = commands # (name, keys, number of key presses)
+        self.rounds = rounds
+        self.warmup = warmup
+        self.samples = {} # name -> [(latency, handled)]
+        self.error = None
+        self.expected = 0
+        self.pressed = 0
+        self.handled = None
+        self.rendered = None
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='nts-bench', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def after_key_press(self, sender):
+        self.pressed += 1
+        if self.pressed == self.expected:
+            self.handled = time.perf_counter()
+
+    def after_render(self, sender):
+        if self.handled is not None and self.rendered is None:
+            self.rendered = time.perf_counter()
+            self.done.set()
+
+    def wait(self, keys, presses):
+        """
+        Send keys and return the times until they were handled and shown.
+        """
+        self.expected = presses
+        self.pressed = 0
+        self.handled = None
+        self.rendered = None
+        self.done.clear()
+        start = time.perf_counter()
+        self.pipe.send_text(keys)
+        if not self.done.wait(session_timeout):
+            raise RuntimeError(f"no response to {keys!r}")
+        return self.rendered - start, self.handled - start
+
+    def run(self):
+        try:
+            deadline = time.perf_counter() + session_timeout
+            app = None
+            while app is None or not app.is_running or app.loop is None:
+                if time.perf_counter() > deadline:
+                    raise RuntimeError("the session did not start")
+                time.sleep(0.01)
+                app = self.app_session.app
+            attached = threading.Event()
+
+            def attach():
+                app.key_processor.after_key_press += self.after_key_press
+                app.after_render += self.after_render
+                attached.set()
+
+            app.loop.call_soon_threadsafe(attach)
+            attached.wait(session_timeout)
+            for i in range(self.warmup + self.rounds):
+                for name, keys, presses in self.commands:
+                    latency, handled = self.wait(keys, presses)
+                    if i >= self.warmup:
+                        self.samples.setdefault(name, []).append((latency, handled))
+        except Exception as e:
+            self.error = e
+        finally:
+            # control-q
+            self.pipe.send_text("\x11")
+
+
+def corpus_values(Data):
+    """
+    Return the replacements for the session script.
+    """
+    Data.setMode('path')
+    Data.showNodes()
+    note = next(x for x in Data.notes if x is not None)
+    tags = sorted([x for x in Data.taghash if x != '~'], key=lambda x: -len(Data.taghash[x]))
+    dirname = next(iter(sorted(Data.dirkeys - {'.'})), '.')
+    ids = sorted(x for x in Data.id2info if len(x) == 2)
+    return {
+            'word': note.title.split()[0],
+            'tag': tags[0] if tags else '~',
+            'dir': os.path.basename(dirname),
+            'id': '-'.join(str(x) for x in ids[len(ids) // 2]) if ids else '1',
+            }
+
+
+def run_session(rootdir, script=None, rounds=20, warmup=1, report=print):
+    """
+    Run the session on the notes in rootdir with input from a pipe and
+    output to a dummy terminal, typing the commands of script, by default
+    session_script, for warmup and then rounds rounds. Return name ->
+    {'seconds', 'p50', 'p95', 'p99', 'max', 'handled', 'runs'} where
+    seconds is p50, the median latency, and handled is the median time
+    until the keys were handled, before the redraw.
+    """
+    from prompt_toolkit.application import create_app_session
+    from prompt_toolkit.input import create_pipe_input
+    from prompt_toolkit.output import DummyOutput
+    import nts.nts as nts
+    from nts.__version__ import version
+
+    # the dimensions of the dummy terminal
+    os.environ['COLUMNS'] = '80'
+    os.environ['LINES'] = '40'
+    nts.nts_version = version
+    nts.Data = nts.NodeData(rootdir)
+    values = corpus_values(nts.Data)
+    commands = [(name, keys.format(**values), count_keys(keys.format(**values)))
+            for name, keys in (script or session_script)]
+
+    with create_pipe_input() as pipe:
+        with create_app_session(input=pipe, output=DummyOutput()) as app_session:
+            driver = SessionDriver(pipe, app_session, commands, rounds, warmup)
+            driver.start()
+            nts.session()
+            driver.thread.join(session_timeout)
+    if driver.error:
+        raise driver.error
+
+    results = {}
+    for name, samples in driver.samples.items():
+        latencies = [x[0] for x in samples]
+        results[name] = {
+                'seconds': percentile(latencies, 50),
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'max': max(latencies),
+                'handled': percentile([x[1] for x in samples], 50),
+                'runs': latencies,
+                }
+        report(format_latency(name, results[name]))
+    return results
+
+
+def format_latency(name, result):
+    return "{:12} {}  handled {:8.1f} ms".format(name,
+            " ".join(f"{x} {1000 * result[x]:8.1f} ms" for x in ['p50', 'p95', 'p99']),
+            1000 * result['handled'])
+
+
+def format_result(name, result):
+    peak = result['peak_bytes']
+    peakstr = f"{peak / 2**20:9.1f} MB" if peak is not None else ""
+    rate = result['per_second']
+    ratestr = f"{rate:12,.0f}/s" if rate is not None else ""
+    return f"{name:32} {1000 * result['seconds']:10.1f} ms {ratestr} {peakstr}"
+
+
+def max_rss():
+    """
+    Return the peak resident memory of this process in bytes or None
+    where the resource module is unavailable.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes except on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def revision():
+    """
+    Return the git revision of the nts source or None.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        res = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=root,
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    except OSError:
+        return None
+    return res.stdout.strip() or None
+
+
+def compare(results, old):
+    """
+    Return lines comparing the times in results with those in old, the
+    results saved for another revision.
+    """
+    lines = [f"{'':32} {'old':>10}    {'new':>10}    {'new/old':>7}"]
+    for name, result in results.items():
+        if name not in old:
+            continue
+        before = old[name]['seconds']
+        after = result['seconds']
+        ratio = f"{after / before:7.2f}" if before else ""
+        lines.append(f"{name:32} {1000 * before:10.1f} ms {1000 * after:10.1f} ms {ratio}")
+    return lines
+
+
+def compare_memory(footprint, old):
+    """
+    Return lines comparing the memory in footprint, from memory_footprint,
+    with that in old, saved for another revision.
+    """
+    import nts.nts as nts
+
+    rows = [
+            ('scan peak', old['scan_peak_bytes'], footprint['scan_peak_bytes']),
+            ('after the scan', old['scan_bytes'], footprint['scan_bytes']),
+            ]
+    for name, size in footprint['structures'].items():
+        if name in old['structures']:
+            rows.append((f"  {name}", old['structures'][name], size))
+    lines = [f"{'':32} {'old':>12} {'new':>12}    {'new/old':>7}"]
+    for name, before, after in rows:
+        ratio = f"{after / before:7.2f}" if before > 0 else ""
+        lines.append(f"{name:32} {nts.format_bytes(before):>12} {nts.format_bytes(after):>12}    {ratio}")
+    return lines
+
+
+def add_corpus_options(parser):
+    for name, default in corpus_defaults.items():
+        parser.add_argument(f"--{name}", type=int, default=default,
+                help=f"(default {default})")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m nts.bench',
+            description="Benchmarks for nts")
+    commands = parser.add_subparsers(dest='command')
+    imports = commands.add_parser('imports',
+            help="time the imports of the command line interface")
+    imports.add_argument('--runs', type=int, default=7,
+            help="the number of runs (default 7)")
+    imports.add_argument('--target', type=float, default=import_target,
+            help=f"the target in milliseconds (default {import_target})")
+
+    corpus = commands.add_parser('corpus',
+            help="write a synthetic data directory")
+    corpus.add_argument('dir', help="the directory for data and corpus.json")
+    add_corpus_options(corpus)
+
+    run = commands.add_parser('run', help="time the NodeData operations")
+    run.add_argument('--data', help="a directory from the corpus command, generated with the corpus options if it does not exist")
+    add_corpus_options(run)
+    run.add_argument('--repeat', type=int, default=3,
+            help="the number of timed runs of each operation (default 3)")
+    run.add_argument('--workers', type=int, default=0,
+            help="the scan_workers setting for the initial scan (default 0)")
+    run.add_argument('--no-memory', action='store_true',
+            help="skip the runs with tracemalloc for the peak memory and the memory report")
+
+    session = commands.add_parser('session',
+            help="time the commands of the interactive session")
+    session.add_argument('--data', help="a directory from the corpus command, generated with the corpus options if it does not exist")
+    add_corpus_options(session)
+    session.add_argument('--rounds', type=int, default=20,
+            help="the number of timed rounds of the script (default 20)")
+    session.add_argument('--warmup', type=int, default=1,
+            help="the number of untimed rounds before these (default 1)")
+    session.add_argument('--script', help="a JSON list of [name, keys] to use instead of the default script")
+
+    for command in [run, session]:
+        command.add_argument('--output', help="save the results as JSON in OUTPUT")
+        command.add_argument('--compare', help="compare the times and memory with the JSON results in COMPARE")
+    args = parser.parse_args()
+
+    if args.command == 'imports':
+        ms, found = time_imports(args.runs)
+        print(f"import time: {ms:.1f} ms (target {args.target:.0f} ms)")
+        if found:
+            print(f"imported when not needed: {', '.join(found)}")
+        return 1 if ms > args.target or found else 0
+
+    if args.command == 'corpus':
+        info = make_corpus(args.dir, **{x: getattr(args, x) for x in corpus_defaults})
+        print(json.dumps(info['counts']))
+        return 0
+
+    if args.command in ['run', 'session']:
+        tmpdir = None
+        outdir = args.data
+        if outdir is None:
+            tmpdir = outdir = tempfile.mkdtemp(prefix='nts-bench-')
+        try:
+            infopath = os.path.join(outdir, 'corpus.json')
+            if os.path.exists(infopath) and os.path.isdir(os.path.join(outdir, 'data')):
+                with open(infopath) as fo:
+                    info = json.load(fo)
+            else:
+                start = time.perf_counter()
+                info = make_corpus(outdir, **{x: getattr(args, x) for x in corpus_defaults})
+                print(f"generated the corpus in {time.perf_counter() - start:.1f} seconds")
+            print(f"corpus: {json.dumps(info['counts'])}")
+            rootdir = os.path.join(outdir, 'data')
+            footprint = None
+            if args.command == 'run':
+                results = run_benchmarks(rootdir, args.repeat, not args.no_memory, args.workers)
+                if not args.no_memory:
+                    import nts.nts as nts
+                    footprint = memory_footprint(rootdir, args.workers)
+                    print()
+                    for line in nts.memory_lines(list(footprint['structures'].items()),
+                            (footprint['scan_bytes'], footprint['scan_peak_bytes']),
+                            footprint['notes']):
+                        print(line)
+            else:
+                script = None
+                if args.script:
+                    with open(args.script) as fo:
+                        script = json.load(fo)
+                results = run_session(rootdir, script, args.rounds, args.warmup)
+        finally:
+            if tmpdir:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+        from nts.__version__ import version
+        saved = {
+                'version': version,
+                'revision': revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'command': args.command,
+                'corpus': info,
+                'max_rss': max_rss(),
+                'results': results,
+                }
+        if footprint is not None:
+            saved['memory'] = footprint
+        if args.output:
+            with open(args.output, 'w') as fo:
+                json.dump(saved, fo, indent=2)
+        if args.compare:
+            with open(args.compare) as fo:
+                old = json.load(fo)
+            print()
+            for line in compare(results, old['results']):
+                print(line)
+            if footprint is not None and 'memory' in old:
+                print()
+                for line in compare_memory(footprint, old['memory']):
+                    print(line)
+        return 0
+
+    parser.print_help()
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,61 +1,92 @@
 import os, fnmatch
 import sys
-from pprint import pprint
-from anytree import Node, RenderTree #, search
-from base64 import b64encode, b64decode
-import base64
 import re
-from prompt_toolkit import prompt, search
-from prompt_toolkit.formatted_text import FormattedText
-from prompt_toolkit.styles import Style
-from prompt_toolkit.widgets import TextArea, SearchToolbar
-from prompt_toolkit.application import Application
-from prompt_toolkit.layout.layout import Layout
-from prompt_toolkit.layout.controls import FormattedTextControl
-from prompt_toolkit.layout.dimension import LayoutDimension as D
-from prompt_toolkit.lexers import Lexer
-from prompt_toolkit.completion import Completer, Completion
-from prompt_toolkit.auto_suggest import AutoSuggest, Suggestion
-
-from prompt_toolkit import PromptSession
-from prompt_toolkit import shortcuts
-from prompt_toolkit.key_binding import KeyBindings
-from prompt_toolkit.application import run_in_terminal
-from prompt_toolkit.filters import Condition
-from prompt_toolkit.validation import Validator, ValidationError
-from prompt_toolkit.layout.controls import BufferControl
-from prompt_toolkit.styles.named_colors import NAMED_COLORS
-
-from prompt_toolkit.buffer import Buffer
-from prompt_toolkit.filters import Condition
-from prompt_toolkit.application.current import get_app
-from prompt_toolkit.layout.containers import HSplit, VSplit, Window, WindowAlign, ConditionalContainer
+# prompt_toolkit, requests, pyperclip and the modules for watching files
+# and for pools of workers are imported where they are first used so
+# that commands that do not need them start quickly
 
 import subprocess
-import requests
-
-from prompt_toolkit import print_formatted_text
 import textwrap
 
 import shutil
 import logging
-import logging.config
-
-import pyperclip
 
 import argparse
+import locale
+import pickle
+import tempfile
+import io
+import time
+import bisect
+from array import array
+from collections import OrderedDict, deque
+from itertools import islice
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError: # python < 3.11
+    import sre_parse, sre_constants
+
+logger = logging.getLogger()
 
 note_regex = re.compile(r'^[\+#]\s+([^\(]+)\s*(\(([^\)]*)\))?\s*$')
 ident_regex = re.compile(r'\d+(-\d+)?\s*$')
+# join terms that can be looked up in the tag names
+plain_regex = re.compile(r'^[\w ]+$')
+
+# the characters other than ASCII letters that match ASCII letters in
+# case-insensitive regular expressions
+ascii_folds = str.maketrans({'\u0130': 'i', '\u0131': 'i', '\u017f': 's', '\u212a': 'k'})
+
+# regex operators whose content is required for a match
+repeat_ops = [getattr(sre_constants, x) for x in ['MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'] if hasattr(sre_constants, x)]
+group_ops = [getattr(sre_constants, x) for x in ['SUBPATTERN', 'ATOMIC_GROUP'] if hasattr(sre_constants, x)]
 
 separator = os.path.sep
 
+# set from cfg.yaml - tag -> the string used in place of the tag when
+# sorting the tags view
+tag_sort = {}
+# set from cfg.yaml - refresh the session view when note files change
+watch_files = False
+# set from cfg.yaml - the style settings for session mode and find
+# output and the Style made from them by get_style
+user_style = {}
+style_obj = None
+
+# increment when the format of the notes returned by getnotes changes
+cache_version = 5
+
+# the encoding used by open for the note files - getnotes and showNotes
+# read the files as bytes to record and use the byte offsets of notes
+file_encoding = locale.getpreferredencoding(False)
+
+# the number of tree displays kept by showNodes for reuse
+view_cache_size = 16
+
+# the number of notes whose wrapped lines are kept for showNotes and find
+wrap_cache_size = 2048
+
+# the number of items of each container measured by approx_size
+size_sample = 20
+
+# the number of recent session commands listed by the 's' command
+recent_commands_size = 8
+
+# set by --timings - phase -> [calls, seconds] in the order in which the
+# phases began, accumulated by span
+timings = None
+
+# set by --memory - the (current, peak) bytes traced by tracemalloc from
+# the start of the scan to its end
+scan_memory = None
+
 
 help_notes = [
 ' h              show this help message.',
 ' ^q or F8       quit.',
 ' v              compare the installed version of nts with the latest version on GitHub (requires an internet connection).',
 ' r              reload data from the files in the data directory to incorporate external changes.',
+' s              show statistics: the numbers of directories, files, notes and tags, the last scan, the times of recent commands, cache hit rates and the approximate memory used.',
 ' p              display path view.',
 ' t              display tags view.',
 ' l              toggle showing leaves in the outline views.',
@@ -72,52 +103,103 @@ help_notes = [
 ' a IDENT [NAME] if IDENT corresponds to either a note or a ".txt" file, then open that file for appending a new note. Otherwise, if IDENT corresponds to a directory and NAME is provided, add a child called NAME to that node. If NAME ends with ".txt", a new note file will be created. Otherwise, a new subdirectory called NAME will be added to the node directory. Use "0" as the IDENT to add to the root (data) node.',
 ]
 
-def get_matches(pattern, line, lineno=None):
-    if not pattern or lineno == 0:
-        return [("class:plain", line)]
-    parts = []
-    last_end = 0
-    for match in re.finditer(pattern, line, re.IGNORECASE):
-        s = match.start()
-        e = match.end()
-        if s > last_end:
-            parts.append(("class:plain", line[last_end:s]))
-        parts.append(("class:highlighted", line[s:e]))
-        last_end = e
-    if line[last_end:]:
-        parts.append(("class:plain", line[last_end:]))
-    return parts
-
-
-class NTSLexer(Lexer):
-    def __init__(self, regex=None):
-        self.regex = None
-
-    def set_regex(self, regex):
-        if regex in ['', None]:
-            self.regex = None
-        else:
-            self.regex = regex
-        # logger.debug(f"lexer regex: '{self.regex}'")
-
-    def lex_document(self, document):
-
-        def get_line(lineno):
-            line = document.lines[lineno]
-            parts = get_matches(self.regex, line, lineno)
-            return parts
-
-        return get_line
-
-
-def myprint(pattern, line):
-    tokenlines = get_matches(pattern, line)
-    print_formatted_text(FormattedText(tokenlines), style=style_obj)
+def get_style():
+    """
+    Return the prompt_toolkit Style for user_style, creating it when first
+    needed.
+    """
+    global style_obj
+    if style_obj is None:
+        from prompt_toolkit.styles import Style
+        style_obj = Style.from_dict(user_style)
+    return style_obj
+
+
+def add_timing(name, seconds):
+    """
+    Log the duration of the phase name and add it to timings.
+    """
+    logger.debug(f"{name}: {1000 * seconds:.1f} ms")
+    if timings is not None:
+        entry = timings.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+
+class span(object):
+    """
+    Time the phase name in a with statement or, as a decorator, in each
+    call of the decorated function. Nested phases are named
+    "phase: subphase".
+    """
+    __slots__ = ['name', 'start', 'seconds']
+
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, func):
+        name = self.name
+        def timed(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        timed.__name__ = func.__name__
+        timed.__doc__ = func.__doc__
+        return timed
+
+    def __enter__(self):
+        if timings is not None:
+            # list phases in the order in which they began
+            timings.setdefault(self.name, [0, 0.0])
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        add_timing(self.name, self.seconds)
+
+
+def timings_lines(total=None):
+    """
+    Return the lines of a table of the phases in timings with the
+    subphases indented below their phases.
+    """
+    groups = OrderedDict() # top level phase -> its phases
+    for name in timings:
+        groups.setdefault(name.split(': ')[0], []).append(name)
+    lines = [f"{'phase':36} {'calls':>7} {'ms':>10}"]
+    for top, names in groups.items():
+        if top not in timings:
+            lines.append(top)
+        for name in sorted(names, key=lambda x: x != top):
+            calls, seconds = timings[name]
+            parts = name.split(': ')
+            label = f"{'  ' * (len(parts) - 1)}{parts[-1]}"
+            lines.append(f"{label:36} {calls:7} {1000 * seconds:10.1f}")
+    if total is not None:
+        lines.append(f"{'total':36} {'':7} {1000 * total:10.1f}")
+    return lines
+
+
+@span('myprint')
+def myprint(pattern, lines):
+    """
+    Print lines with the matches for pattern highlighted using a single
+    call to print_formatted_text.
+    """
+    from prompt_toolkit import print_formatted_text
+    from prompt_toolkit.formatted_text import FormattedText
+    from nts.view import get_matches
+    tokenlines = []
+    for line in lines:
+        tokenlines.extend(get_matches(pattern, line))
+        tokenlines.append(("", "\n"))
+    print_formatted_text(FormattedText(tokenlines), style=get_style(), end="")
 
 
 def check_update():
     url = "https://raw.githubusercontent.com/dagraham/nts-dgraham/master/nts/__version__.py"
     try:
+        import requests
         r = requests.get(url)
         t = r.text.strip()
         # t will be something like "version = '4.7.2'"
@@ -152,67 +234,710 @@ def splitall(path):
     return allparts
 
 
-def mypathsort(items):
-    return sorted(items, key=lambda item: item.name)
+def tagsortkey(name):
+    """
+    Return the key used to order tag nodes in the tags view.
+    """
+    first, *rest = name.split(' ')
+    return tag_sort.get(first, first) + ' '.join(rest)
+
+
+class Tree(object):
+    """
+    A tree of nodes identified by their nodeids. The nodes are stored in
+    lists indexed by node position with the positions of the parent,
+    first and last children and previous and next siblings of each node,
+    its depth and its path, the names from the root joined by separator.
+    Children are kept in the order of their sort keys, which default to
+    their names, with ties broken by name so that the order does not
+    depend on the order in which they were added. The positions of
+    removed nodes are reused.
+    """
+
+    def __init__(self):
+        self.positions = {} # nodeid -> position
+        self.nodeids = []
+        self.names = []
+        self.sortkeys = []
+        self.lines = [] # the Notes for 'notes' nodes, otherwise None
+        self.paths = []
+        self.depths = []
+        self.parents = []
+        self.firsts = []
+        self.lasts = []
+        self.prevs = []
+        self.nexts = []
+        self.free = [] # unused positions
+        self.unsorted = set() # positions whose children need sorting
+
+    def __contains__(self, nodeid):
+        return nodeid in self.positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def add(self, nodeid, name, parent=None, sortkey=None, lines=None):
+        """
+        Add a node as the child of the node with nodeid parent or as the
+        root if parent is None.
+        """
+        # e.g. the tags 'a b' and 'ab' have the same tagsortkey
+        sortkey = (name if sortkey is None else sortkey, name)
+        if parent is None:
+            up, depth, path = -1, 0, name
+        else:
+            up = self.positions[parent]
+            depth = self.depths[up] + 1
+            path = f"{self.paths[up]}{separator}{name}"
+        values = (nodeid, name, sortkey, lines, path, depth, up, -1, -1, -1, -1)
+        columns = (self.nodeids, self.names, self.sortkeys, self.lines,
+                self.paths, self.depths, self.parents, self.firsts,
+                self.lasts, self.prevs, self.nexts)
+        if self.free:
+            pos = self.free.pop()
+            for column, value in zip(columns, values):
+                column[pos] = value
+        else:
+            pos = len(self.nodeids)
+            for column, value in zip(columns, values):
+                column.append(value)
+        self.positions[nodeid] = pos
+        if up >= 0:
+            # append to the children and sort them when needed
+            last = self.lasts[up]
+            if last < 0:
+                self.firsts[up] = pos
+            else:
+                self.nexts[last] = pos
+                self.prevs[pos] = last
+                if sortkey < self.sortkeys[last]:
+                    self.unsorted.add(up)
+            self.lasts[up] = pos
+        return pos
+
+    def remove(self, nodeid):
+        """
+        Remove the node with nodeid, if any, and its descendants.
+        """
+        pos = self.positions.get(nodeid)
+        if pos is None:
+            return
+        up = self.parents[pos]
+        if up >= 0:
+            prev, next = self.prevs[pos], self.nexts[pos]
+            if prev < 0:
+                self.firsts[up] = next
+            else:
+                self.nexts[prev] = next
+            if next < 0:
+                self.lasts[up] = prev
+            else:
+                self.prevs[next] = prev
+        stack = [pos]
+        while stack:
+            pos = stack.pop()
+            stack.extend(self.children(pos))
+            del self.positions[self.nodeids[pos]]
+            self.unsorted.discard(pos)
+            # drop the references to the name and the notes
+            self.nodeids[pos] = self.names[pos] = self.sortkeys[pos] = None
+            self.lines[pos] = self.paths[pos] = None
+            self.free.append(pos)
+
+    def children(self, pos):
+        """
+        Return the positions of the children of the node at pos.
+        """
+        children = []
+        child = self.firsts[pos]
+        while child >= 0:
+            children.append(child)
+            child = self.nexts[child]
+        return children
+
+    def setSortKey(self, pos, sortkey):
+        self.sortkeys[pos] = (sortkey, self.names[pos])
+        if self.parents[pos] >= 0:
+            self.unsorted.add(self.parents[pos])
+
+    def sort(self):
+        """
+        Put the children of nodes with added children or changed sort
+        keys in order.
+        """
+        for up in self.unsorted:
+            children = self.children(up)
+            if not children:
+                continue
+            children.sort(key=self.sortkeys.__getitem__)
+            prev = -1
+            for pos in children:
+                self.prevs[pos] = prev
+                if prev >= 0:
+                    self.nexts[prev] = pos
+                prev = pos
+            self.nexts[prev] = -1
+            self.firsts[up] = children[0]
+            self.lasts[up] = prev
+        self.unsorted = set()
+
+    def render(self, nodeid, maxlevel=None):
+        """
+        Yield (pre, fill, pos) for the node with nodeid and its
+        descendants in the order and with the prefixes used by anytree's
+        RenderTree. With maxlevel, only the nodes less than maxlevel
+        levels below the node are included.
+        """
+        self.sort()
+        pos = self.positions[nodeid]
+        maxdepth = self.depths[pos] + maxlevel - 1 if maxlevel else None
+        yield "", "", pos
+        if maxdepth is not None and self.depths[pos] >= maxdepth:
+            return
+        # (position, fill of its parent) for the nodes still to be shown
+        stack = [(self.firsts[pos], "")] if self.firsts[pos] >= 0 else []
+        while stack:
+            pos, fill = stack.pop()
+            if self.nexts[pos] >= 0:
+                stack.append((self.nexts[pos], fill))
+                pre, fill = f"{fill}├── ", f"{fill}│   "
+            else:
+                pre, fill = f"{fill}└── ", f"{fill}    "
+            yield pre, fill, pos
+            if self.firsts[pos] >= 0 and (maxdepth is None or self.depths[pos] < maxdepth):
+                stack.append((self.firsts[pos], fill))
+
+
+def fingerprint(filepath):
+    """
+    Return (mtime_ns, size, inode) for filepath or None if it cannot be
+    read.
+    """
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class Note(object):
+    """
+    A note parsed from a note file. The same record is used for the note
+    by the path and tag trees, taghash, the indexes and find. Tag strings
+    and paths are interned and the body lines are joined into a single
+    string, or None if there are none, to keep the records small.
+    """
+    __slots__ = ('id', 'titlestr', 'tagstr', 'tags', 'filepath', 'linenum',
+            'body', 'start', 'end')
+
+    def __init__(self, title, tags, filepath, linenum, start=None, end=None, body=None):
+        self.id = None # integer id, assigned by NodeData.addFile
+        self.titlestr = f"+ {title}"
+        self.tags = tuple([sys.intern(x) for x in tags])
+        self.tagstr = sys.intern(f" ({', '.join(tags)})") if tags else ""
+        self.filepath = sys.intern(filepath)
+        self.linenum = linenum
+        self.body = body
+        # the byte offsets of the title line and of the next line beginning
+        # with '+' or the end of the file
+        self.start = start
+        self.end = end
 
+    def __getstate__(self):
+        return tuple([getattr(self, x) for x in self.__slots__])
 
-def mytagsort(items):
-    return sorted(items, key=lambda item: tag_sort.get(item.name.split(' ')[0], item.name.split(' ')[0]) + ' '.join(item.name.split(' ')[1:]))
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+        # unpickled strings are copies - share them again with the rest
+        self.tags = tuple([sys.intern(x) for x in self.tags])
+        self.tagstr = sys.intern(self.tagstr)
+        self.filepath = sys.intern(self.filepath)
 
+    @property
+    def title(self):
+        return self.titlestr[2:]
 
-def getnotes(filepath):
-    notes = []
-    with open(filepath, 'r') as fo:
-        lines = fo.readlines()
+    @property
+    def key(self):
+        return (self.filepath, self.linenum)
 
-    note = [] # [title, [tags], linenum, [body]]
+    def lines(self, body=None):
+        """
+        Return the title line, with the tags, and the lines of body or,
+        if body is not given, of the note's body.
+        """
+        lines = [f"{self.titlestr}{self.tagstr}"]
+        if body is None:
+            body = self.body
+        if body is not None:
+            lines.extend(body.split("\n"))
+        return lines
+
+
+class BodyCache(object):
+    """
+    A cache of note bodies keyed by note id and holding at most budget
+    bytes of bodies. Bodies are only added while there is room. Find
+    reads every body, so with a least recently used cache smaller than the
+    bodies each find would evict the bodies before they were used again
+    and read every file. Instead the cached bodies are kept and only the
+    files with notes that are not cached are read.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.size = 0
+        self.bodies = {}
+
+    def __contains__(self, noteid):
+        return noteid in self.bodies
+
+    def get(self, noteid):
+        return self.bodies[noteid]
+
+    def room(self):
+        return self.budget - self.size
+
+    def put(self, noteid, body):
+        self.discard(noteid)
+        size = sys.getsizeof(body)
+        if size > self.room():
+            return
+        self.bodies[noteid] = body
+        self.size += size
+
+    def discard(self, noteid):
+        if noteid in self.bodies:
+            self.size -= sys.getsizeof(self.bodies.pop(noteid))
+
+
+def getnotes(filepath, data=None):
+    """
+    Return (notes, errors) for filepath, or for data, the bytes read from
+    it, reading a line at a time. notes are Note records in the order of
+    their lines. errors are (linenum, line) for the lines beginning with
+    '+' that are not note titles, without their line endings.
+    """
+    notes = []
+    errors = []
+    note = None
     body = []
+    unended = [] # notes whose end offsets are not yet known
+    offset = 0
     linenum = -1
-    for line in lines:
-        linenum += 1
-        if line and line[0] == "+" and not note_regex.match(line):
-            print(f"Error failed to match: '{line}'\nin filepath: '{filepath}'")
-        if note_regex.match(line):
-            if note:
+    # with newline='' the line endings are split as usual but kept as
+    # they are in the file so that the byte offsets can be computed
+    if data is None:
+        fo = open(filepath, 'r', encoding=file_encoding, newline='')
+    else:
+        fo = io.TextIOWrapper(io.BytesIO(data), encoding=file_encoding, newline='')
+    with fo:
+        for line in fo:
+            linenum += 1
+            start = offset
+            offset += len(line) if line.isascii() else len(line.encode(file_encoding))
+            first = line[:1]
+            if first != '+' and first != '#':
+                # not a title - lines before the first note are skipped
+                if note is not None:
+                    body.append(line.rstrip())
+                continue
+            if first == '+':
+                for x in unended:
+                    x.end = start
+                unended = []
+            m = note_regex.match(line)
+            if m is None:
+                if first == '+':
+                    errors.append((linenum, line.rstrip('\r\n')))
+                if note is not None:
+                    body.append(line.rstrip())
+                continue
+            if note is not None:
                 if body and not body[-1]:
-                    body = body[:-1]
-                note.append(body)
+                    body.pop()
+                note.body = "\n".join(body) if body else None
                 notes.append(note)
-            note = []
             body = []
-            m = note_regex.match(line)
-            title = m.group(1).strip() if m and m.group(1) else line.strip()
-            tags = [x.strip() for x in m.group(3).split(',')] if m and m.group(3) else []
-
-            note_begin = linenum
-            note = [title, tags, linenum]
-        else:
-            body.append(line.rstrip())
-    if note:
+            title = m.group(1).strip()
+            tags = [x.strip() for x in m.group(3).split(',')] if m.group(3) else []
+            note = Note(title, tags, filepath, linenum, start)
+            unended.append(note)
+    for x in unended:
+        x.end = offset
+    if note is not None:
         if body and not body[-1]:
-            body = body[:-1]
-        note.append(body)
+            body.pop()
+        note.body = "\n".join(body) if body else None
         notes.append(note)
-        note = []
-        body = []
-    return notes
+    return notes, errors
+
+
+def wrap_lines(lines, width):
+    """
+    Return lines wrapped to width with the continuation lines indented
+    and empty lines kept.
+    """
+    wrapped = []
+    for line in lines:
+        # textwrap will return and empty list if passed a line with only white space characters
+        line = line.rstrip()
+        if line:
+            wrapped.extend(textwrap.wrap(line, width=width, subsequent_indent="  "))
+        else:
+            wrapped.append("")
+    return wrapped
+
+
+def readfile(filepath):
+    with open(filepath, 'rb') as fo:
+        return fo.read()
+
+
+def listdir(path):
+    """
+    Return (dirs, files, walkdirs) for path in the order and with the
+    classification used by os.walk where walkdirs are the dirs that
+    os.walk would descend into, or None if path cannot be listed.
+    """
+    dirs = []
+    files = []
+    walkdirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    dirs.append(entry.name)
+                    if not entry.is_symlink():
+                        walkdirs.append(entry.name)
+                else:
+                    files.append(entry.name)
+    except OSError:
+        return None
+    return dirs, files, walkdirs
+
+
+def walkdirs(rootdir, pool):
+    """
+    Equivalent to os.walk(rootdir) but with the directories on each level
+    listed concurrently using pool.
+    """
+    listings = {}
+    level = [rootdir]
+    while level:
+        listed = pool.map(listdir, level)
+        nextlevel = []
+        for path, listing in zip(level, listed):
+            if listing is None:
+                continue
+            listings[path] = listing
+            nextlevel.extend([os.path.join(path, x) for x in listing[2]])
+        level = nextlevel
+
+    # yield the listings in the top-down order used by os.walk
+    stack = [rootdir]
+    while stack:
+        path = stack.pop()
+        if path not in listings:
+            continue
+        dirs, files, walk = listings[path]
+        yield path, dirs, files
+        stack.extend([os.path.join(path, x) for x in reversed(walk)])
+
+
+def fold(text):
+    """
+    Return text casefolded for the trigram index.
+    """
+    return text.translate(ascii_folds).casefold()
+
+
+def notetrigrams(lines):
+    """
+    Return the set of folded trigrams in lines for the trigram index.
+    """
+    trigrams = set()
+    for line in lines:
+        line = fold(line)
+        trigrams.update([line[i:i+3] for i in range(len(line) - 2)])
+    return trigrams
+
+
+def flatten(items):
+    # groups in a sequence match their contents in the same sequence
+    for op, av in items:
+        if op in group_ops:
+            yield from flatten(av[-1] if op == sre_constants.SUBPATTERN else av)
+        else:
+            yield op, av
+
+
+def trigram_query(items):
+    """
+    Return a query for the trigrams that any line matching the parsed
+    regex items must contain. A query is either a trigram, ('and',
+    [queries]), ('or', [queries]) or None if nothing is required. Only
+    runs of ASCII literals are used, folded as in the trigram index.
+    """
+    required = []
+    run = []
+
+    def flush():
+        text = "".join(run)
+        required.extend([text[i:i+3] for i in range(len(text) - 2)])
+        run.clear()
+
+    for op, av in flatten(items):
+        if op == sre_constants.LITERAL:
+            c = fold(chr(av))
+            if len(c) == 1 and c.isascii():
+                run.append(c)
+                continue
+        flush()
+        query = None
+        if op in repeat_ops and av[0] >= 1:
+            query = trigram_query(av[2])
+        elif op == sre_constants.BRANCH:
+            alternatives = [trigram_query(x) for x in av[1]]
+            if None not in alternatives:
+                query = ('or', alternatives)
+        if query is not None:
+            required.append(query)
+    flush()
+    if not required:
+        return None
+    return required[0] if len(required) == 1 else ('and', required)
+
+
+def regex_trigrams(find):
+    """
+    Return the trigram query for the regular expression find or None if
+    no trigrams can be derived.
+    """
+    try:
+        return trigram_query(sre_parse.parse(find))
+    except Exception:
+        return None
+
+
+def add_posting(index, term, noteid):
+    """
+    Add noteid to the sorted array of ids for term in index.
+    """
+    postings = index.get(term)
+    if postings is None:
+        index[term] = array('I', [noteid])
+    elif postings[-1] < noteid:
+        postings.append(noteid)
+    else:
+        bisect.insort(postings, noteid)
+
+
+def remove_posting(index, term, noteid):
+    """
+    Remove noteid from the sorted array of ids for term in index and
+    drop term when none are left.
+    """
+    postings = index.get(term)
+    if postings is None:
+        return
+    i = bisect.bisect_left(postings, noteid)
+    if i < len(postings) and postings[i] == noteid:
+        del postings[i]
+        if not postings:
+            del index[term]
+
+
+def bitset(ids):
+    """
+    Return an int with the bits for the integers in ids set.
+    """
+    ids = list(ids)
+    if not ids:
+        return 0
+    bits = bytearray((max(ids) >> 3) + 1)
+    for i in ids:
+        bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def bitids(bits):
+    """
+    Yield the positions of the bits set in the int bits.
+    """
+    # position i in digits is bit i
+    digits = format(bits, 'b')[::-1]
+    i = digits.find('1')
+    while i >= 0:
+        yield i
+        i = digits.find('1', i + 1)
+
+
+def approx_size(obj, depth=3, skip=()):
+    """
+    Return an estimate of the bytes used by obj and the objects it
+    contains down to depth levels. Only a sample of size_sample items,
+    evenly spaced, of each container is measured and the result scaled
+    up. Instances of the types in skip, e.g. the Notes referred to by
+    the trees, are not counted.
+    """
+    if obj is None or (skip and isinstance(obj, skip)):
+        return 0
+    size = sys.getsizeof(obj)
+    if depth <= 0:
+        return size
+    if isinstance(obj, dict):
+        count = len(obj)
+        sample = list(islice(obj.items(), 0, None, max(1, count // size_sample)))
+    elif isinstance(obj, (list, tuple)):
+        count = len(obj)
+        sample = obj[::max(1, count // size_sample)]
+    elif isinstance(obj, (set, frozenset)):
+        # the sets in NodeData hold note ids shared with the Notes
+        return size
+    elif hasattr(obj, '__slots__'):
+        return size + sum(approx_size(getattr(obj, x, None), depth - 1, skip) for x in obj.__slots__)
+    elif hasattr(obj, '__dict__'):
+        return size + approx_size(vars(obj), depth, skip)
+    else:
+        return size
+    if not sample:
+        return size
+    measured = sum(approx_size(x, depth - 1, skip) for x in sample)
+    return size + count * measured // len(sample)
+
+
+def memory_usage(Data):
+    """
+    Return [(structure, bytes)] for the memory, as traced by tracemalloc,
+    used by the main structures of Data after showing the path and tag
+    views and building the find index. Each structure is credited with the memory freed by dropping
+    it after those before it, so memory shared with a later structure,
+    e.g. the Notes referred to by the trees, is credited to the later
+    one. This empties Data.
+    """
+    import gc
+    import tracemalloc
+
+    for mode in ['path', 'tags']:
+        Data.setMode(mode)
+        Data.showNodes()
+    if Data.keepbodies and Data.trigramindex is None:
+        Data.indexNotes()
+    usage = []
+
+    def traced():
+        gc.collect()
+        return tracemalloc.get_traced_memory()[0]
+
+    before = traced()
+
+    def credit(structure):
+        nonlocal before
+        after = traced()
+        usage.append((structure, before - after))
+        before = after
+
+    for key, (id2info, lines) in list(Data.views.items()):
+        Data.views[key] = (id2info, [])
+    Data.nodelines = Data.headerlines = Data.notelines = Data.findlines = []
+    Data.wraps.clear()
+    credit('rendered lines')
+
+    Data.views.clear()
+    Data.id2info = {}
+    credit('id2info')
+
+    Data.nodes = None
+    Data.tagnodes = Tree()
+    Data.taghash = {}
+    Data.tagstrnotes = {}
+    Data.tagbits = {}
+    Data.tagstrbits = {}
+    Data.termtags = {}
+    credit('tag tree')
+
+    Data.pathnodes = Tree()
+    Data.filekeys = {}
+    Data.dirkeys = set()
+    credit('path tree')
+
+    Data.trigramindex = None
+    credit('trigram index')
+
+    Data.notes = []
+    Data.freeids = []
+    Data.filenotes = {}
+    if Data.bodies is not None:
+        Data.bodies = BodyCache(Data.bodies.budget)
+    credit('notes')
+
+    usage.append(('other', before))
+    return usage
+
+
+def memory_lines(usage, scan, notes):
+    """
+    Return the lines of a report of the memory used by the scan, with
+    scan the (current, peak) bytes traced during it, and of the usage
+    from memory_usage for notes notes.
+    """
+    current, peak = scan
+    total = sum(x[1] for x in usage)
+    lines = [
+            f"{'scan peak':32} {format_bytes(peak):>12}",
+            f"{'after the scan':32} {format_bytes(current):>12}",
+            f"{'with the views and find index':32} {format_bytes(total):>12}",
+            ]
+    for structure, size in usage:
+        share = f"{100 * size / total:5.1f}%" if total else ""
+        lines.append(f"  {structure:30} {format_bytes(size):>12} {share}")
+    if notes:
+        lines.extend([
+                f"{'bytes per note after the scan':32} {current // notes:>12,}",
+                f"{'bytes per note with the index':32} {total // notes:>12,}",
+                ])
+    return lines
+
+
+def format_bytes(size):
+    for unit in ['bytes', 'KB', 'MB']:
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'bytes' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
 
 
 class NodeData(object):
 
-    def __init__(self, rootdir):
+    def __init__(self, rootdir, cachefile=None, workers=0, store=None, bodycache=0):
         self.rootdir = rootdir
-
-        self.pathnodes = {} # nodeid -> node for path tree
+        self.cachefile = cachefile # persistent parse cache, if any
+        self.workers = workers # use pools with this many workers if > 1
+        self.store = store # NoteStore for the sqlite backend, if any
+        # with a store, the note bodies are only kept in the database and
+        # the trigram index is not used
+        self.bodies = BodyCache(bodycache) if bodycache and not store else None
+        # with a budget in bytes for bodycache, only the titles, tags and
+        # locations of notes are kept in memory, the trigram index is not
+        # used and find reads the bodies from the note files through the
+        # cache
+        self.keepbodies = not (store or self.bodies) # bodies in memory
+
+        self.pathnodes = Tree() # the path tree
         # nodeid = relative filepath to directory or file
-        # nodes corresponding to files have a lines attribute
-        # where the lines are tuples (title, tags, linenum)
-        # and the filepath is implicitly given by the nodeid.
+        # nodes corresponding to files have a 'notes' child with lines,
+        # the Note records for the file.
         # rows in the tree display have consecutively numbered
         # treeid's with the format "#" for directories and files and
         # the format "#-#" for lines (notes)
 
-        self.tagnodes = {}  # nodeid -> node for tag tree
+        self.tagnodes = Tree() # the tag tree
         # for tags, the tree has the form
         #    tag X -> [notes containing tag X]
         # and thus has only two levels. Here the nodeid is
@@ -233,7 +958,51 @@ class NodeData(object):
         self.findlines = [] # find display lines
         # populated with find() generates lines
 
-        self.notedetails = {}
+        # showNodes and find only recompute their lines when the state
+        # they depend on differs from that of the last computation
+        self.generation = 0 # incremented when the trees change
+        self.nodeskey = None # the state for id2info and nodelines
+        self.views = OrderedDict() # the state -> (id2info, lines) for
+        # the most recently shown tree displays
+        self.wraps = OrderedDict() # (note id, kind) -> (fingerprint,
+        # width, lines) for the most recently wrapped notes
+        self.headerlines = [] # the header part of nodelines
+        self.findkey = None # the state for findlines
+
+        self.fingerprints = {} # filepath -> (mtime_ns, size, inode)
+        # used by getNodes to parse only added or changed files
+        self.filenotes = {} # filepath -> Notes from getnotes(filepath)
+        self.filekeys = {} # filepath -> nodeid in pathnodes
+        self.fileorder = {} # filepath -> position in the last walk
+        self.dirkeys = set() # nodeids in pathnodes for directories
+        self.taghash = {} # tag -> Notes with the tag
+        self.notes = [] # integer id -> Note or None if unused
+        self.freeids = [] # unused integer ids
+        # the find index, built by indexNotes when first needed
+        self.trigramindex = None # folded trigram -> sorted array of the
+        # ids of the notes containing the trigram
+        self.parseerrors = {} # filepath -> (linenum, line) for the lines
+        # beginning with '+' that are not note titles in the files parsed
+        self.tagstrnotes = {} # tagstr -> ids of the notes with tagstr
+        # the bitsets, with bit i for the note with integer id i, used for
+        # join. These are computed when needed and dropped when changed.
+        self.tagbits = {} # tag -> bitset of the notes with tag
+        self.tagstrbits = {} # tagstr -> bitset of the notes with tagstr
+        self.termtags = {} # plain join term -> tags containing it
+        # kept for the statistics shown by statsLines
+        self.cachestats = {x: [0, 0] for x in ['views', 'find', 'wraps', 'bodies']}
+        # cache -> [hits, misses]
+        self.textbytes = 0 # the total size of the note files
+        self.lastscan = {} # the time, duration and file counts of the
+        # last call of getNodes
+        self.cachedirty = False # the cache needs to be saved, which in a
+        # session is left until it ends
+        self.cached = self.loadCache() # filepath -> (fingerprint, notes,
+        # errors)
+        if self.store and not self.cached:
+            with span('cachedNotes'):
+                self.cached = self.store.cachedNotes()
+
         self.shownotes = True
         self.shownodes = True
         self.sessionMode = False
@@ -250,6 +1019,7 @@ class NodeData(object):
 
         self.mode = 'path'
         self.showingNodes = True
+        self.shownid = None # the id of the note last shown by showID
 
 
     def set_findregex(self, regex):
@@ -339,56 +1109,410 @@ class NodeData(object):
         self.start = start
 
 
-    def getNodes(self):
+    @span('getNodes')
+    def getNodes(self, filepaths=None):
         """
-        Create node trees for pathnodes and tagnodes.
+        Create node trees for pathnodes and tagnodes. Only the files that
+        have been added, changed or removed since the last call, as judged
+        by their fingerprints, are parsed and pathnodes, tagnodes and the
+        indexes are patched in place. If filepaths, the files reported
+        as changed by a watcher or an edit, are all existing note files,
+        only these are checked and the directories are not walked. Return
+        True if anything has changed.
         """
-        taghash = {}
-        self.pathnodes = {}
-        self.tagnodes = {}
-        self.notedetails = {}
-        for root, dirs, files in os.walk(self.rootdir):
+        started = time.perf_counter()
+        pool = None
+        if self.workers > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            pool = ThreadPoolExecutor(self.workers)
+        try:
+            with span('getNodes: walk'):
+                fps = None
+                if filepaths is not None and all(x in self.fingerprints for x in filepaths):
+                    filepaths = list(filepaths)
+                    fps = [fingerprint(x) for x in filepaths]
+                    if None in fps:
+                        # a file has been removed
+                        fps = None
+                if fps is not None:
+                    dirkeys = self.dirkeys
+                    fileorder = self.fileorder
+                else:
+                    dirkeys, fileorder = self.walkNodes(pool)
+                    filepaths = list(fileorder)
+                    fps = pool.map(fingerprint, filepaths) if pool else map(fingerprint, filepaths)
+                changed = [(x, fp) for x, fp in zip(filepaths, fps) if fp is None or fp != self.fingerprints.get(x)]
+
+            # the notes for files that are unchanged since the cache was saved
+            notes = {}
+            fromcache = 0
+            for filepath, fp in changed:
+                cached = self.cached.pop(filepath, None)
+                if fp is None:
+                    notes[filepath] = []
+                elif cached and cached[0] == fp:
+                    notes[filepath] = cached[1]
+                    self.setErrors(filepath, cached[2])
+                    fromcache += 1
+            toparse = [x for x, fp in changed if x not in notes]
+            with span('getNodes: parse'):
+                for filepath, (filenotes, errors) in zip(toparse, self.parseFiles(toparse, pool)):
+                    notes[filepath] = filenotes
+                    self.setErrors(filepath, errors)
+        finally:
+            if pool:
+                pool.shutdown()
+        self.fileorder = fileorder
+        if self.store:
+            with span('getNodes: store'):
+                self.store.sync(changed, notes, self.parseerrors, self.filekeys, fileorder)
+
+        affected = set() # tags whose lists need to be updated
+        with span('getNodes: trees'):
+            removed = [x for x in self.fingerprints if x not in fileorder]
+            for filepath in removed:
+                self.dropFile(filepath, affected)
+                self.pathnodes.remove(self.filekeys.pop(filepath))
+                if self.fingerprints[filepath]:
+                    self.textbytes -= self.fingerprints[filepath][1]
+                del self.fingerprints[filepath]
+                self.parseerrors.pop(filepath, None)
+
+            dirschanged = dirkeys != self.dirkeys
+            for key in self.dirkeys - dirkeys:
+                self.pathnodes.remove(key)
+            self.dirkeys = dirkeys
+
+            for filepath, fp in changed:
+                self.dropFile(filepath, affected)
+                if self.fingerprints.get(filepath):
+                    self.textbytes -= self.fingerprints[filepath][1]
+                if fp:
+                    self.textbytes += fp[1]
+                self.fingerprints[filepath] = fp
+                self.addFile(filepath, notes[filepath], affected)
+        # the cache needs to be saved unless every file came from it and
+        # entries left in the cache are for files that no longer exist
+        if removed or toparse or self.cached:
+            self.cachedirty = True
+        # the cache is only needed for the first scan
+        self.cached = {}
+
+        with span('getNodes: tags'):
+            for tag in affected:
+                self.tagbits.pop(tag, None)
+                lines = self.taghash.get(tag, [])
+                lines.sort(key=lambda x: (fileorder[x.filepath], x.linenum))
+                self.updateTag(tag, lines)
+            if '.' not in self.tagnodes:
+                self.tagnodes.add('.', '.')
+        # rewriting the whole cache after each edit in a session would
+        # cost more than parsing the edited file again on the next start
+        if self.cachedirty and not self.sessionMode:
+            with span('getNodes: saveCache'):
+                self.saveCache()
+        self.lastscan = {
+                'time': time.time(),
+                'seconds': time.perf_counter() - started,
+                'checked': len(filepaths),
+                'changed': len(changed),
+                'parsed': len(toparse),
+                'cached': fromcache,
+                'removed': len(removed),
+                }
+        if changed or removed or dirschanged:
+            self.generation += 1
+            return True
+        return False
+
+
+    def walkNodes(self, pool=None):
+        """
+        Walk rootdir adding nodes to pathnodes for new directories and
+        note files. Return the nodeids of the directories and a dict
+        mapping the note file paths to their positions in the walk.
+        """
+        dirkeys = set()
+        fileorder = {} # filepath -> position in the walk
+        walk = walkdirs(self.rootdir, pool) if pool else os.walk(self.rootdir)
+        for root, dirs, files in walk:
             relroot = splitall(os.path.relpath(root, self.rootdir))
             if relroot[0] != '.':
                 relroot.insert(0, '.')
             parent = separator.join(relroot[:-1])
             child = relroot[-1]
             key = separator.join(relroot)
-            if parent:
-                self.pathnodes[key] = Node(child, parent=self.pathnodes[parent])
-            else:
-                self.pathnodes[key] = Node(child)
+            dirkeys.add(key)
+            if key not in self.pathnodes:
+                self.pathnodes.add(key, child, parent if parent else None)
             files = [x for x in files if fnmatch.fnmatch(x, "[!.]*.txt")]
             for file in files:
-                key = separator.join(relroot)
-                filepath = os.path.join(root, file)
-                self.pathnodes[f"{key}{separator}{file}"] = Node(file, self.pathnodes[key])
-                tmp = f"{key}{separator}{file}"
-                notes = getnotes(filepath)
-                if notes:
-                    notelines = []
-                    for x in notes:
-                        #  x: [title, [tags], linenum, [body]]
-                        titlestr = f"+ {x[0]}"
-                        tagstr = f" ({', '.join(x[1])})" if x[1] else ""
-                        tmp = [f"{titlestr}{tagstr}"]
-                        tmp.extend(x[3])
-                        self.notedetails[(filepath, x[2])] = tmp
-                        notelines.append([titlestr, tagstr,  (filepath, x[2])])
-                        if x[1]:
-                            for tag in x[1]:
-                                taghash.setdefault(tag, []).append([titlestr, tagstr, (filepath, x[2])])
-                        else:
-                            # assign the no-tag tag '~'
-                            taghash.setdefault('~', []).append([titlestr, tagstr, (filepath, x[2])])
-                    self.pathnodes[f"{key}{separator}{file}{separator}notes"] = Node('notes', self.pathnodes[f"{key}{separator}{file}"], lines=notelines)
+                filepath = sys.intern(os.path.join(root, file))
+                filekey = f"{key}{separator}{file}"
+                fileorder[filepath] = len(fileorder)
+                if filekey not in self.pathnodes:
+                    self.pathnodes.add(filekey, file, key)
+                    self.filekeys[filepath] = filekey
+        return dirkeys, fileorder
+
+
+    def setErrors(self, filepath, errors):
+        """
+        Record the parse errors for filepath from getnotes in parseerrors
+        and report them.
+        """
+        if errors:
+            self.parseerrors[filepath] = errors
+        else:
+            self.parseerrors.pop(filepath, None)
+        for linenum, line in errors:
+            logger.warning(f"failed to match line {linenum + 1} of {filepath}: '{line}'")
+            if not self.sessionMode:
+                # the line is quoted with its newline as it was before
+                # getnotes returned the errors
+                print(f"Error failed to match: '{line}\n'\nin filepath: '{filepath}'")
+
+
+    def parseFiles(self, filepaths, pool=None):
+        """
+        Return (notes, errors) from getnotes for each of filepaths. With a
+        thread pool, the files are read using the pool. Parsing is cheap
+        compared to sending the notes back from worker processes, so the
+        files are always parsed in this thread.
+        """
+        if not pool:
+            return [getnotes(x) for x in filepaths]
+        contents = pool.map(readfile, filepaths)
+        return [getnotes(x, y) for x, y in zip(filepaths, contents)]
+
+
+    @span('loadCache')
+    def loadCache(self):
+        """
+        Return the parsed notes stored in cachefile by saveCache or an
+        empty dict if the cache is missing, corrupt or from another
+        version or data directory.
+        """
+        if not (self.cachefile and os.path.isfile(self.cachefile)):
+            return {}
+        try:
+            with open(self.cachefile, 'rb') as fo:
+                cache = pickle.load(fo)
+            if (cache.get('version') == cache_version and cache.get('rootdir') == self.rootdir
+                    and cache.get('bodies') == self.keepbodies):
+                return cache['files']
+            logger.info(f"ignoring stale cache {self.cachefile}")
+        except Exception as e:
+            logger.warning(f"ignoring corrupt cache {self.cachefile}: {e}")
+        return {}
+
+
+    def saveCache(self):
+        """
+        Write the fingerprints, parsed notes and parse errors for every
+        file to cachefile. The cache is written to a temporary file which then
+        replaces cachefile so that a crash cannot leave a partial cache.
+        """
+        if not self.cachefile:
+            return
+        cache = {
+                'version': cache_version,
+                'rootdir': self.rootdir,
+                'bodies': self.keepbodies,
+                'files': {x: (fp, self.filenotes.get(x, []), self.parseerrors.get(x, []))
+                    for x, fp in self.fingerprints.items() if fp is not None},
+                }
+        cachedir = os.path.dirname(os.path.abspath(self.cachefile))
+        tmppath = None
+        try:
+            fd, tmppath = tempfile.mkstemp(dir=cachedir, prefix='.cache-')
+            with os.fdopen(fd, 'wb') as fo:
+                pickle.dump(cache, fo, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmppath, self.cachefile)
+            self.cachedirty = False
+        except Exception as e:
+            logger.warning(f"could not save cache {self.cachefile}: {e}")
+            if tmppath and os.path.exists(tmppath):
+                os.remove(tmppath)
+
+
+    def dropFile(self, filepath, affected):
+        """
+        Remove the notes from filepath from the trigram index, taghash and
+        the path tree, free their ids and record the tags they used in
+        affected.
+        """
+        tags = set()
+        for note in self.filenotes.pop(filepath, []):
+            self.notes[note.id] = None
+            self.freeids.append(note.id)
+            if note.tagstr:
+                self.tagstrbits.pop(note.tagstr, None)
+                ids = self.tagstrnotes[note.tagstr]
+                ids.discard(note.id)
+                if not ids:
+                    del self.tagstrnotes[note.tagstr]
+            if self.bodies is not None:
+                self.bodies.discard(note.id)
+            for kind in ['show', 'find']:
+                self.wraps.pop((note.id, kind), None)
+            if self.trigramindex is not None:
+                for trigram in notetrigrams(note.lines()):
+                    remove_posting(self.trigramindex, trigram, note.id)
+            tags.update(note.tags if note.tags else ['~'])
+        for tag in tags:
+            self.taghash[tag] = [x for x in self.taghash.get(tag, []) if x.filepath != filepath]
+        affected.update(tags)
+        self.pathnodes.remove(f"{self.filekeys.get(filepath)}{separator}notes")
+
+
+    def addFile(self, filepath, notes, affected):
+        """
+        Add the notes from filepath to the trigram index, the path tree
+        and taghash, assigning their ids and recording their tags in
+        affected.
+        """
+        if not notes:
+            return
+        self.filenotes[filepath] = notes
+        filekey = self.filekeys[filepath]
+        for note in notes:
+            if self.freeids:
+                note.id = self.freeids.pop()
+                self.notes[note.id] = note
+            else:
+                note.id = len(self.notes)
+                self.notes.append(note)
+            if note.tagstr:
+                self.tagstrnotes.setdefault(note.tagstr, set()).add(note.id)
+                self.tagstrbits.pop(note.tagstr, None)
+            if not self.keepbodies:
+                # the bodies are in the store or the note files
+                note.body = None
+            elif self.trigramindex is not None:
+                for trigram in notetrigrams(note.lines()):
+                    add_posting(self.trigramindex, trigram, note.id)
+            # assign the no-tag tag '~' to notes without tags
+            for tag in (note.tags if note.tags else ['~']):
+                if tag not in self.taghash:
+                    # a new tag may contain the plain join terms
+                    self.termtags = {}
+                self.taghash.setdefault(tag, []).append(note)
+                affected.add(tag)
+        self.pathnodes.add(f"{filekey}{separator}notes", 'notes', filekey, lines=notes)
+
+
+    @span('indexNotes')
+    def indexNotes(self):
+        """
+        Build the trigram index from the notes in memory. This is left to
+        the first find that needs it since the index is larger than the
+        notes and most runs never search. addFile and dropFile then keep
+        it up to date.
+        """
+        self.trigramindex = {}
+        # the notes in id order so that the ids are appended in order
+        for note in self.notes:
+            if note is not None:
+                for trigram in notetrigrams(note.lines()):
+                    add_posting(self.trigramindex, trigram, note.id)
+
+
+    def getNote(self, filepath, linenum):
+        """
+        Return the Note beginning at linenum in filepath or None.
+        """
+        notes = self.filenotes.get(filepath, [])
+        lo, hi = 0, len(notes)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if notes[mid].linenum < linenum:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(notes) and notes[lo].linenum == linenum:
+            return notes[lo]
+        return None
+
+
+    def updateTag(self, tag, lines):
+        """
+        Set the lines for tag in taghash and tagnodes, adding or removing
+        the tag node as necessary.
+        """
+        key = f".{separator}{tag}"
+        if not lines:
+            # a tag has been removed - new tags are noted by addFile
+            self.termtags = {}
+            self.taghash.pop(tag, None)
+            self.tagnodes.remove(key)
+            return
+        self.taghash[tag] = lines
+        notekey = f"{key}{separator}notes"
+        if notekey in self.tagnodes:
+            self.tagnodes.lines[self.tagnodes.positions[notekey]] = lines
+        else:
+            if '.' not in self.tagnodes:
+                self.tagnodes.add('.', '.')
+            self.tagnodes.add(key, tag, '.', tagsortkey(tag))
+            self.tagnodes.add(notekey, 'notes', key, lines=lines)
+
+    @span('sortTags')
+    def sortTags(self):
+        """
+        Recompute the sort keys of the tag nodes after tag_sort changes.
+        """
+        tree = self.tagnodes
+        for pos in tree.children(tree.positions['.']):
+            tree.setSortKey(pos, tagsortkey(tree.names[pos]))
+        self.generation += 1
 
+    def termBits(self, regex):
+        """
+        Return the bitset of the notes whose tag strings match the join
+        term regex. Plain ASCII words, which can only match within a
+        single tag, are looked up in the tags. Otherwise the regex is run
+        once for each distinct tag string.
+        """
+        term = regex.pattern
+        if term.isascii() and plain_regex.match(term):
+            if term not in self.termtags:
+                term = term.lower()
+                self.termtags[regex.pattern] = [x for x in self.taghash if x != '~' and term in x.translate(ascii_folds).lower()]
+            bits = 0
+            for tag in self.termtags[regex.pattern]:
+                if tag not in self.tagbits:
+                    self.tagbits[tag] = bitset([x.id for x in self.taghash[tag] if x.tagstr])
+                bits |= self.tagbits[tag]
+            return bits
+        bits = 0
+        for tagstr, ids in self.tagstrnotes.items():
+            if regex.search(tagstr):
+                if tagstr not in self.tagstrbits:
+                    self.tagstrbits[tagstr] = bitset(ids)
+                bits |= self.tagstrbits[tagstr]
+        return bits
+
+
+    def joinIds(self):
+        """
+        Return the ids of the notes whose tag strings satisfy join by
+        combining the bitsets for its terms.
+        """
+        mode, regxs = self.join
+        bits = None
+        for regex in regxs:
+            termbits = self.termBits(regex)
+            if bits is None:
+                bits = termbits
+            elif mode == 'and':
+                bits &= termbits
+            else:
+                bits |= termbits
+            if mode == 'and' and not bits:
+                break
+        return set(bitids(bits))
 
-        self.tagnodes['.'] = Node('.')
-        for key, values in taghash.items():
-            self.tagnodes[f".{separator}{key}"] = Node(key, self.tagnodes['.'])
-            self.tagnodes[f".{separator}{key}{separator}notes"] = Node('notes',
-                    self.tagnodes[f".{separator}{key}"], lines=[x for x in values])
 
     def getHeader(self):
         output_lines = []
@@ -401,10 +1525,47 @@ class NodeData(object):
             output_lines.append(self.getstr)
         return output_lines
 
+    def nodesKey(self):
+        """
+        Return the state on which id2info and the lines of the tree
+        display, nodelines without the header, depend.
+        """
+        return (self.generation, self.mode, self.start, self.maxlevel,
+                self.get.pattern if self.get else None,
+                (self.join[0], tuple([x.pattern for x in self.join[1]])) if self.join else None,
+                self.shownotes, self.shownodes, self.columns, self.sessionMode)
+
+    @span('showNodes')
     def showNodes(self):
         self.columns, self.rows = shutil.get_terminal_size()
         column_adjust = 2 if self.sessionMode else 1
         self.setlimits()
+        nodeskey = self.nodesKey()
+        if nodeskey in self.views:
+            self.cachestats['views'][0] += 1
+            self.views.move_to_end(nodeskey)
+        else:
+            self.cachestats['views'][1] += 1
+            if self.views and next(iter(self.views))[0] != self.generation:
+                # the trees have changed
+                self.views.clear()
+            with span('showNodes: renderNodes'):
+                self.views[nodeskey] = self.renderNodes(column_adjust)
+            if len(self.views) > view_cache_size:
+                self.views.popitem(last=False)
+        header_lines = self.getHeader()
+        if nodeskey != self.nodeskey or header_lines != self.headerlines:
+            self.id2info, output_lines = self.views[nodeskey]
+            self.nodelines = header_lines + output_lines
+            self.headerlines = header_lines
+            self.nodeskey = nodeskey
+
+
+    def renderNodes(self, column_adjust):
+        """
+        Return id2info and the lines of the tree display for the current
+        settings.
+        """
         id = 0
         id2info = {}
         linenum = 0
@@ -412,92 +1573,77 @@ class NodeData(object):
         output_lines = []
 
 
-        start = self.nodes.get(self.start, self.nodes['.'])
-        showlevel = self.maxlevel + 1 if self.maxlevel else None
-        thissort = mypathsort if self.mode == 'path' else mytagsort
+        if self.join:
+            # the ids of the notes satisfying the join
+            if self.store:
+                joinids = {self.getNote(*x).id for x in self.store.joinKeys(*self.join)}
+            else:
+                joinids = self.joinIds()
 
-        for pre, fill, node in RenderTree(start, childiter=thissort, maxlevel=showlevel):
-            # node with lines are only used for notes
-            if node.name != '.' and not hasattr(node, 'lines'):
+        tree = self.nodes
+        start = self.start if self.start in tree else '.'
+        showlevel = self.maxlevel + 1 if self.maxlevel else None
+        for pre, fill, pos in tree.render(start, showlevel):
+            name = tree.names[pos]
+            lines = tree.lines[pos]
+            # only the 'notes' nodes have lines
+            if name != '.' and lines is None:
                 id += 1
             idstr = f" {id}"
-            path = [x.name for x in node.path]
-            pathstr = separator.join(path)
+            pathstr = tree.paths[pos]
             if self.get or self.join:
                 pre = fill = ""
 
             if self.get and not self.get.search(pathstr):
                 continue
 
-            if self.join:
-                mode, regxs = self.join
-
-            if node.name.endswith('.txt'):
+            if name.endswith('.txt'):
                 pathstr = os.path.join(self.rootdir, pathstr[2:])
 
             if self.shownotes:
                 notenum = 0
-                if hasattr(node, 'lines') and node.lines:
-                    for line in node.lines:
-                        # titlestr, tagstring,  (filepath, linenum)
+                if lines:
+                    for note in lines:
                         ### join ###
                         if self.join:
-                            if not line[1]:
+                            if note.id not in joinids:
                                 continue
                             pre = fill = ""
-                            # ok = True
-                            for r in regxs:
-                                if r.search(line[1]):
-                                    # logger.debug(f"match in {line[1]}")
-                                    ok = True
-                                    if mode in ['or', None]:
-                                        break
-                                    else: # and
-                                        continue
-                                else: # no match
-                                    ok = False
-                                    if mode in ['and', None]:
-                                        break
-                                    else: # or
-                                        continue
-                            if not ok:
-                                continue
                         ### join ###
 
                         notenum += 1
-                        title = line[0]
+                        title = note.titlestr
                         if self.shownodes:
-                            excess = len(f"{fill}{title}{line[1]} {id}-{notenum}") + column_adjust - self.columns
+                            excess = len(f"{fill}{title}{note.tagstr} {id}-{notenum}") + column_adjust - self.columns
                             if excess >= 0:
                                 width = len(title) - excess - column_adjust
                                 title = textwrap.shorten(title, width=width)
-                            output_lines.append(f"{fill}{title}{line[1]} {id}-{notenum}")
+                            output_lines.append(f"{fill}{title}{note.tagstr} {id}-{notenum}")
                         else:
-                            excess = len(f"{title}{line[1]} {id}-{notenum}") + column_adjust - self.columns
+                            excess = len(f"{title}{note.tagstr} {id}-{notenum}") + column_adjust - self.columns
                             if excess >= 0:
                                 width = len(title) - excess - column_adjust
                                 title = textwrap.shorten(title, width=width)
-                            output_lines.append(f"{title}{line[1]} {id}-{notenum}")
-                        id2info[(id, notenum)] = line[2]
+                            output_lines.append(f"{title}{note.tagstr} {id}-{notenum}")
+                        id2info[(id, notenum)] = note.key
                 else:
                     id2info[(id,)] = (pathstr, None)
 
                     if id > 0 and self.shownodes and not self.get and not self.join:
-                        output_lines.append(f"{pre}{node.name}{idstr}")
+                        output_lines.append(f"{pre}{name}{idstr}")
             else:
-                if hasattr(node, 'lines'):
+                if lines is not None:
                     linenum -= 1
 
                 else:
                     id2info[(id,)] = (pathstr, None)
                     if id > 0 and self.shownodes:
-                        output_lines.append(f"{pre}{node.name}{idstr}")
+                        output_lines.append(f"{pre}{name}{idstr}")
 
-        self.id2info = id2info
-        header_lines = self.getHeader()
-        self.nodelines = header_lines + output_lines
+        return id2info, output_lines
 
 
+    @span('showNotes')
     def showNotes(self, filepath, linenum=None, leafstr=""):
         """display the contens of filepath starting with linenum"""
 
@@ -506,42 +1652,181 @@ class NodeData(object):
         output_lines = []
         if leafstr:
             output_lines.append(leafstr)
-        with open(filepath, 'r') as fo:
-            lines = fo.readlines()
+        width = self.columns - column_adjust
         if linenum is None:
-            for line in lines:
-                line = line.rstrip()
-                if line:
-                    output_lines.extend(textwrap.wrap(line,
-                        width=self.columns-column_adjust,
-                        subsequent_indent="  ",
-                        ))
-                else:
-                    output_lines.append("")
+            with open(filepath, 'r') as fo:
+                lines = fo.readlines()
+            with span('showNotes: wrap'):
+                output_lines.extend(wrap_lines(lines, width))
         else:
-            output_lines.append(lines[linenum].rstrip())
-            for line in lines[linenum+1:]:
-                # textwrap will return and empty list if passed a line with only white space characters
-                line = line.rstrip()
-                if line.startswith('+'):
-                    if not output_lines[-1]:
-                        # skip the last empty line
-                        output_lines = output_lines[:-1]
-                    break
-                if line:
-                    output_lines.extend(textwrap.wrap(line,
-                        width=self.columns-column_adjust,
-                        subsequent_indent="  ",
-                        ))
-                else:
-                    output_lines.append("")
+            wrapped = None
+            if fingerprint(filepath) == self.fingerprints.get(filepath):
+                wrapped = self.getWrap(self.getNote(filepath, linenum), 'show', width)
+            if wrapped is None:
+                lines, ended = self.noteLines(filepath, linenum)
+                with span('showNotes: wrap'):
+                    wrapped = [lines[0].rstrip()] + wrap_lines(lines[1:], width)
+                if ended and not wrapped[-1]:
+                    # skip the last empty line
+                    wrapped = wrapped[:-1]
+                self.putWrap(self.getNote(filepath, linenum), 'show', width, wrapped)
+            output_lines.extend(wrapped)
 
         self.notelines = output_lines
 
 
+    def getWrap(self, note, kind, width):
+        """
+        Return the lines of note wrapped to width for kind, 'show' for the
+        title and body lines from the note file used by showNotes or
+        'find' for the body lines used by find, if they are in the wrap
+        cache and the note file is unchanged, otherwise None.
+        """
+        if note is None:
+            return None
+        if (note.id, kind) not in self.wraps:
+            self.cachestats['wraps'][1] += 1
+            return None
+        fp, wrapwidth, lines = self.wraps[(note.id, kind)]
+        if wrapwidth != width or fp != self.fingerprints.get(note.filepath):
+            self.cachestats['wraps'][1] += 1
+            return None
+        self.cachestats['wraps'][0] += 1
+        self.wraps.move_to_end((note.id, kind))
+        return lines
+
+
+    def putWrap(self, note, kind, width, lines):
+        if note is None:
+            return
+        self.wraps[(note.id, kind)] = (self.fingerprints.get(note.filepath), width, lines)
+        self.wraps.move_to_end((note.id, kind))
+        if len(self.wraps) > wrap_cache_size:
+            self.wraps.popitem(last=False)
+
+
+    def noteLines(self, filepath, linenum):
+        """
+        Return the lines of filepath from linenum up to the next line
+        beginning with '+' and whether such a line ended them. For a note
+        these are read from the byte offsets recorded by getnotes, after
+        parsing the file again if it has changed.
+        """
+        if fingerprint(filepath) != self.fingerprints.get(filepath):
+            self.getNodes([filepath])
+        note = self.getNote(filepath, linenum)
+        fp = self.fingerprints.get(filepath)
+        if note is None or fp is None:
+            # not the first line of a note
+            with open(filepath, 'r') as fo:
+                lines = fo.readlines()[linenum:]
+            for i, line in enumerate(lines[1:], 1):
+                if line.startswith('+'):
+                    return lines[:i], True
+            return lines, False
+        with open(filepath, 'rb') as fo:
+            fo.seek(note.start)
+            data = fo.read(note.end - note.start)
+        return [x.decode(file_encoding) for x in data.splitlines(keepends=True)], note.end < fp[1]
+
+
+    def noteBodies(self, notes):
+        """
+        Yield (note, lines) for notes with lines as from Note.lines. When
+        the bodies are not kept in memory, those that are not in the body
+        cache are read from the note files, each file once and in the
+        order of their paths.
+        """
+        if self.keepbodies:
+            for note in notes:
+                yield note, note.lines()
+            return
+        filenotes = {}
+        for note in notes:
+            filenotes.setdefault(note.filepath, []).append(note)
+        for filepath in sorted(filenotes):
+            notes = filenotes[filepath]
+            bodies = self.loadBodies(filepath, notes)
+            for note in notes:
+                yield note, note.lines(bodies.get(note.id))
+
+
+    def loadBodies(self, filepath, notes):
+        """
+        Return note id -> body for notes from filepath, parsing the file
+        again if any of them are not in the body cache. The bodies of all
+        the notes in the file are then cached if there is room for all of
+        them, so that the file need not be read again. If the file has
+        changed since it was parsed, only the notes whose title lines are
+        unchanged are given bodies and these are not cached.
+        """
+        bodies = {x.id: self.bodies.get(x.id) for x in notes if x.id in self.bodies}
+        self.cachestats['bodies'][0] += len(bodies)
+        self.cachestats['bodies'][1] += len(notes) - len(bodies)
+        if len(bodies) == len(notes):
+            return bodies
+        unchanged = fingerprint(filepath) == self.fingerprints.get(filepath)
+        try:
+            parsed, errors = getnotes(filepath)
+        except OSError as e:
+            logger.warning(f"could not read {filepath}: {e}")
+            return bodies
+        current = {(x.linenum, x.titlestr, x.tagstr): x.body for x in parsed}
+        found = {}
+        for note in self.filenotes.get(filepath, []):
+            key = (note.linenum, note.titlestr, note.tagstr)
+            if key in current:
+                found[note.id] = current[key]
+        missing = [x for x in found if x not in self.bodies]
+        if unchanged and sum([sys.getsizeof(found[x]) for x in missing]) <= self.bodies.room():
+            for noteid in missing:
+                self.bodies.put(noteid, found[noteid])
+        for note in notes:
+            if note.id in found:
+                bodies.setdefault(note.id, found[note.id])
+        return bodies
+
+
+    def findCandidates(self, find):
+        """
+        Return the ids of the notes that could contain a match for find.
+        These are the notes containing the trigrams that a match for find
+        requires. If there are none, e.g. for words shorter than three
+        characters, every note is a candidate.
+        """
+        query = regex_trigrams(find)
+        if query is not None:
+            return self.trigramCandidates(query)
+        return [x.id for x in self.notes if x is not None]
+
+
+    def trigramCandidates(self, query):
+        """
+        Return the ids of the notes satisfying the trigram query from
+        regex_trigrams.
+        """
+        if self.trigramindex is None:
+            self.indexNotes()
+        if isinstance(query, str):
+            return set(self.trigramindex.get(query, ()))
+        mode, queries = query
+        if mode == 'or':
+            return set().union(*[self.trigramCandidates(x) for x in queries])
+        # intersect starting with the shortest postings
+        idsets = sorted([self.trigramindex.get(x, ()) if isinstance(x, str) else self.trigramCandidates(x)
+                for x in queries], key=len)
+        candidates = set(idsets[0])
+        for ids in idsets[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(ids)
+        return candidates
+
+
+    @span('find')
     def find(self, find=None):
         # logger.debug(f"find: '{find}'")
-        matching_keys = []
+        matching_keys = set()
         output_lines = []
         self.find_lines = []
         column_adjust = 4 if self.sessionMode else 2
@@ -550,39 +1835,57 @@ class NodeData(object):
         if not find:
             # logger.debug("cancelling find")
             self.findlines = []
+            self.findkey = None
+            return
+        # the matches are listed in the order of id2info, which needs to
+        # be remade if the trees have changed since it was shown, e.g. by
+        # the watcher or by noteLines
+        if self.nodeskey is not None and self.nodeskey[0] != self.generation:
+            self.showNodes()
+        findkey = (find, self.generation, self.nodeskey, shutil.get_terminal_size()[0])
+        if findkey == self.findkey:
+            self.cachestats['find'][0] += 1
             return
+        self.cachestats['find'][1] += 1
         findstr = f'notes with matches for "{find}"'.center(self.columns - 2)
         regex = re.compile(r'%s' % find, re.IGNORECASE)
-        for key, lines in self.notedetails.items():
-            match = False
-            for line in lines:
-                match = regex.search(line)
-                if match:
-                    # logger.debug(f"match: {match}")
-                    break
-            if match:
-                matching_keys.append(key)
-        if matching_keys:
-            self.columns, rows = shutil.get_terminal_size()
-            for identifier, key in self.id2info.items():
-                if key in matching_keys:
-                    lines = self.notedetails.get(key, [])
-                    idstr = "-".join([str(x) for x in identifier])
-                    output_lines.append(f"{lines[0]} {idstr}")
-                    for line in lines[1:]:
-                        line.rstrip()
-                        if line:
-                            output_lines.extend(textwrap.wrap(line,
-                                width=self.columns-column_adjust,
-                                subsequent_indent="  ",
-                                ))
-                        else:
-                            output_lines.append('')
-                    output_lines.append('')
-            if output_lines and not output_lines[-1]:
-                output_lines = output_lines[:-1]
+        with span('find: search'):
+            if self.store:
+                details = dict(self.store.find(regex, regex_trigrams(find)))
+                matching_keys = details.keys()
+            else:
+                details = {}
+                if self.keepbodies:
+                    candidates = [self.notes[x] for x in self.findCandidates(find)]
+                else:
+                    candidates = [x for x in self.notes if x is not None]
+                for note, lines in self.noteBodies(candidates):
+                    for line in lines:
+                        if regex.search(line):
+                            details[note.key] = lines
+                            break
+                matching_keys = details.keys()
+        with span('find: output'):
+            if matching_keys:
+                self.columns, rows = shutil.get_terminal_size()
+                width = self.columns - column_adjust
+                for identifier, key in self.id2info.items():
+                    if key in matching_keys:
+                        lines = details.get(key, [])
+                        idstr = "-".join([str(x) for x in identifier])
+                        output_lines.append(f"{lines[0]} {idstr}")
+                        note = self.getNote(*key)
+                        wrapped = self.getWrap(note, 'find', width)
+                        if wrapped is None:
+                            wrapped = wrap_lines(lines[1:], width)
+                            self.putWrap(note, 'find', width, wrapped)
+                        output_lines.extend(wrapped)
+                        output_lines.append('')
+                if output_lines and not output_lines[-1]:
+                    output_lines = output_lines[:-1]
         header_lines = [findstr]
         self.findlines = header_lines + output_lines
+        self.findkey = findkey
 
 
     def showID(self, idstr=None):
@@ -626,6 +1929,7 @@ class NodeData(object):
             leafstr = leafstr.center(self.columns - 2)
             filepath, linenum = info
             self.showNotes(filepath, linenum, leafstr)
+            self.shownid = idstr
             if not self.sessionMode:
                 for line in self.notelines:
                     print(line)
@@ -635,6 +1939,24 @@ class NodeData(object):
             return([False, f"Bad IDENT {idstr}"])
 
 
+    def reshowID(self):
+        """
+        Show the note last shown by showID again after the trees have
+        changed if its id still belongs to a note and otherwise the tree.
+        Return True if the note is shown.
+        """
+        self.showNodes()
+        try:
+            info = self.id2info.get(tuple([int(x) for x in self.shownid.split('-')]))
+        except (AttributeError, ValueError):
+            info = None
+        if info is None or info[1] is None:
+            self.showingNodes = True
+            return False
+        self.showID(self.shownid)
+        return True
+
+
     def editID(self, idstr):
         idtup = tuple([int(x) for x in idstr.split('-')])
         info = self.id2info.get(idtup, ('.', ))
@@ -656,6 +1978,19 @@ class NodeData(object):
         return (True, f"Called {editcmd}")
 
 
+    def idFile(self, idstr):
+        """
+        Return the note file for the node or note with IDENT idstr or None
+        if it is not a note file.
+        """
+        try:
+            idtup = tuple([int(x) for x in idstr.split('-')])
+        except ValueError:
+            return None
+        filepath = self.id2info.get(idtup, ('.', ))[0]
+        return filepath if os.path.isfile(filepath) else None
+
+
     def addID(self, idstr, text=None):
         retval = ""
         if not self.mode == 'path':
@@ -674,6 +2009,7 @@ class NodeData(object):
             if not os.path.isdir(path):
                 return (False, f"error: bad path {path}")
             if not text:
+                from prompt_toolkit import prompt
                 text = prompt(
                         f"directory or filename (ending in '.txt') to add as a child of\n {path}\n> ")
                 text = text.strip()
@@ -710,10 +2046,94 @@ class NodeData(object):
         else:
             return (False, f"error: bad index {info}")
 
+    def statsLines(self, commands=None, lexer=None):
+        """
+        Return the lines of a summary of the notes, the last scan, the
+        cache hit rates and the approximate memory used by the main
+        structures. These come from counters kept by getNodes, showNodes
+        and the caches and from samples of the structures rather than from
+        the notes themselves. commands are the (name,
+        seconds) of recent session commands and lexer the session's
+        NTSLexer.
+        """
+        self.columns, self.rows = shutil.get_terminal_size()
+        tags = sum(1 for tag, notes in self.taghash.items() if notes and tag != '~')
+        lines = ['statistics'.center(self.columns - 2), '', ' notes']
+        for label, value in [
+                ('directories', f"{len(self.dirkeys):,}"),
+                ('files', f"{len(self.fileorder):,}"),
+                ('notes', f"{len(self.notes) - len(self.freeids):,}"),
+                ('tags', f"{tags:,}"),
+                ('text', format_bytes(self.textbytes)),
+                ]:
+            lines.append(f"   {label:24} {value:>12}")
+
+        if self.lastscan:
+            scan = self.lastscan
+            lines.extend(['', f" last scan at {time.strftime('%H:%M:%S', time.localtime(scan['time']))}"])
+            for label, value in [
+                    ('duration', f"{1000 * scan['seconds']:.1f} ms"),
+                    ('files checked', f"{scan['checked']:,}"),
+                    ('files changed', f"{scan['changed']:,}"),
+                    ('files parsed', f"{scan['parsed']:,}"),
+                    ('files from the cache', f"{scan['cached']:,}"),
+                    ('files removed', f"{scan['removed']:,}"),
+                    ]:
+                lines.append(f"   {label:24} {value:>12}")
+
+        if commands:
+            lines.extend(['', ' recent commands'])
+            for name, seconds in commands:
+                lines.append(f"   {name[:24]:24} {1000 * seconds:9.1f} ms")
+
+        caches = [
+                ('tree displays', self.cachestats['views']),
+                ('find results', self.cachestats['find']),
+                ('wrapped notes', self.cachestats['wraps']),
+                ]
+        if self.bodies is not None:
+            caches.append(('note bodies', self.cachestats['bodies']))
+        if lexer is not None:
+            caches.append(('highlighted lines', [lexer.hits, lexer.misses]))
+        lines.extend(['', ' cache hit rates'])
+        for label, (hits, misses) in caches:
+            rate = f"{100 * hits / (hits + misses):.0f}%" if hits + misses else "~"
+            lines.append(f"   {label:24} {rate:>12}   {hits:,} of {hits + misses:,}")
+
+        lines.extend(['', ' approximate memory'])
+        for label, size in [
+                ('path tree', approx_size(self.pathnodes, skip=(Note, ))),
+                ('tag tree', approx_size(self.tagnodes, skip=(Note, ))),
+                ('notes', approx_size(self.notes)),
+                ('trigram index', approx_size(self.trigramindex)),
+                ('id2info', approx_size(self.id2info)),
+                (f'tree displays ({len(self.views)})', approx_size(self.views, 4, skip=(Note, ))),
+                (f'wrapped notes ({len(self.wraps)})', approx_size(self.wraps, 4)),
+                ]:
+            lines.append(f"   {label:24} {format_bytes(size):>12}")
+        return lines
+
 
 def session():
+    from prompt_toolkit.application import Application
+    from prompt_toolkit.application.current import get_app
+    from prompt_toolkit.buffer import Buffer
+    from prompt_toolkit.completion import Completer, Completion
+    from prompt_toolkit.filters import Condition
+    from prompt_toolkit.key_binding import KeyBindings
+    from prompt_toolkit.layout.containers import HSplit, VSplit, Window, WindowAlign, ConditionalContainer
+    from prompt_toolkit.layout.controls import BufferControl, FormattedTextControl
+    from prompt_toolkit.layout.layout import Layout
+    from prompt_toolkit.layout.margins import ScrollbarMargin
+    from prompt_toolkit.layout.processors import BeforeInput
+    from prompt_toolkit.styles import Style
+    from prompt_toolkit.widgets import TextArea
+    from nts.view import NTSLexer, LinesControl
+
+    started = time.perf_counter()
     columns, rows = shutil.get_terminal_size()
     Data.sessionMode = True
+    recent_commands = deque(maxlen=recent_commands_size) # (name, seconds)
     # logger.debug(f"session_edit: {session_edit}")
     # logger.debug(f"session_add: {session_edit}")
 
@@ -760,10 +2180,6 @@ def session():
             ], height=1)
 
 
-    search_field = SearchToolbar(text_if_not_searching=[
-        ('class:not-searching', "Press '/' to start searching.")], ignore_case=True)
-
-
     @Condition
     def is_querying():
         return get_app().layout.has_focus(entry_area)
@@ -771,29 +2187,77 @@ def session():
 
     @Condition
     def is_not_searching():
-        return not get_app().layout.has_focus(search_field)
+        return not get_app().layout.has_focus(search_buffer)
 
 
     @Condition
     def is_not_typing():
-        return not (get_app().layout.has_focus(search_field) or
+        return not (get_app().layout.has_focus(search_buffer) or
                 get_app().layout.has_focus(entry_area)
                 )
 
     findlexer = NTSLexer()
 
-    text_area = TextArea(
-        text="",
-        read_only=True,
-        scrollbar=True,
-        search_field=search_field,
-        lexer=findlexer,
+    lines_control = LinesControl(findlexer)
+
+    text_area = Window(
+        content=lines_control,
+        wrap_lines=True,
+        right_margins=[ScrollbarMargin(display_arrows=True)],
         style="class:plain"
         )
 
 
-    def set_text(txt, row=0):
-        text_area.text = txt
+    def set_lines(lines):
+        lines_control.set_lines(lines)
+
+
+    def set_text(txt):
+        lines_control.set_lines(txt.split("\n"))
+
+
+    def search_changed(buf):
+        # incremental search from the line where the search began
+        if not get_app().layout.has_focus(search_buffer):
+            return
+        lines_control.search_text = buf.text
+        lines_control.search(buf.text, lines_control.backward, lines_control.search_start)
+
+    search_buffer = Buffer(multiline=False, on_text_changed=search_changed)
+
+    search_bindings = KeyBindings()
+
+    @search_bindings.add('enter')
+    def _(event):
+        application.layout.focus(lines_control)
+        search_buffer.reset()
+
+    @search_bindings.add('c-c')
+    @search_bindings.add('c-g')
+    @search_bindings.add('escape', eager=True)
+    def _(event):
+        " Abort the search and restore the cursor. "
+        application.layout.focus(lines_control)
+        search_buffer.reset()
+        lines_control.search_text = ''
+        lines_control.row = lines_control.search_start
+
+    search_field = HSplit([
+        ConditionalContainer(
+            content=Window(BufferControl(
+                buffer=search_buffer,
+                input_processors=[BeforeInput(
+                    lambda: 'I-search backward: ' if lines_control.backward else 'I-search: ',
+                    style='class:search-toolbar.prompt')],
+                key_bindings=search_bindings,
+                ), height=1, style='class:search-toolbar'),
+            filter=~is_not_searching),
+        ConditionalContainer(
+            content=Window(FormattedTextControl([
+                ('class:not-searching', "Press '/' to start searching.")]),
+                height=1, style='class:search-toolbar'),
+            filter=is_not_searching),
+        ])
 
     msg_buffer = Buffer()
 
@@ -821,7 +2285,7 @@ def session():
 
         def get_completions(self, document, complete_event):
             text_before_cursor = document.text_before_cursor
-            m = ident_regex.search(text_area.document.current_line)
+            m = ident_regex.search(lines_control.current_line)
             if m and m.group(0).startswith(text_before_cursor):
                 # logger.debug(f"suggestion: {m.group(0)}")
                 yield Completion(
@@ -852,21 +2316,23 @@ def session():
     def accept(buf):
         global active_key
         arg = entry_window.text
-        ret = dispatch[active_key][1](arg)
-        # logger.debug(f"active_key: {active_key}; showingNodes: {Data.showingNodes}")
-        if ret and not ret[0]:
-            set_text(f"\n {ret[1]} ")
-        else:
-            if active_key == 'f':
-                text = "\n".join(Data.findlines)
+        with span(f"session: command {active_key}") as timer:
+            ret = dispatch[active_key][1](arg)
+            # logger.debug(f"active_key: {active_key}; showingNodes: {Data.showingNodes}")
+            if ret and not ret[0]:
+                set_text(f"\n {ret[1]} ")
             else:
-                if Data.showingNodes:
-                    text = "\n".join(Data.nodelines)
+                if active_key == 'f':
+                    lines = Data.findlines
                 else:
-                    text = "\n".join(Data.notelines)
-            set_text(text)
+                    if Data.showingNodes:
+                        lines = Data.nodelines
+                    else:
+                        lines = Data.notelines
+                set_lines(lines)
+        recent_commands.append((f"{active_key} {arg}".strip(), timer.seconds))
         show_entry_area = False
-        application.layout.focus(text_area)
+        application.layout.focus(lines_control)
 
 
     entry_window.accept_handler = accept
@@ -896,7 +2362,8 @@ def session():
             # logger.debug(f"findlines: {Data.findlines}")
             if Data.findlines:
                 findlexer.set_regex(regex)
-                text = "\n".join(Data.findlines)
+                # accept shows Data.findlines
+                text = ""
                 ok = True
             else:
                 text = f'no matches found for "{regex}"'
@@ -916,20 +2383,19 @@ def session():
         Data.setMode(orig_mode)
         Data.showNodes()
         if Data.showingNodes:
-            text = "\n".join(Data.nodelines)
+            set_lines(Data.nodelines)
         else:
-            text = "\n".join(Data.notelines)
-        set_text(text)
+            set_lines(Data.notelines)
 
 
     def copy_view():
-        pyperclip.copy(text_area.text)
+        import pyperclip
+        pyperclip.copy(lines_control.text)
         set_text("\n view copied to system clipboard")
 
 
     def set_max(level):
         Data.setMaxLevel(level)
-        Data.getNodes()
         Data.showNodes()
 
 
@@ -949,8 +2415,10 @@ def session():
         if not idstr:
             return
         orig_mode = Data.mode
+        filepath = Data.idFile(idstr)
         Data.editID(idstr)
-        Data.getNodes()
+        # only the edited file needs to be checked
+        Data.getNodes([filepath] if filepath else None)
         Data.setMode(orig_mode)
         Data.showNodes()
 
@@ -963,9 +2431,11 @@ def session():
         idstr = tmp.split('-')[0]
         if child:
             child = '_'.join(child)
+        filepath = Data.idFile(idstr)
         ok, res = Data.addID(idstr, child)
         if ok:
-            Data.getNodes()
+            # a new note in an existing file only requires checking the file
+            Data.getNodes([filepath] if filepath else None)
             Data.setMode(orig_mode)
             Data.showNodes()
         else:
@@ -973,11 +2443,9 @@ def session():
 
 
     def show_ident(ident):
+        # showID leaves nodelines or notelines current
         ok, res = Data.showID(ident)
-        if ok:
-            Data.getNodes()
-            Data.showNodes()
-        else:
+        if not ok:
             return (ok, res)
 
     # Key bindings.
@@ -1027,8 +2495,8 @@ def session():
                     ))
             else:
                 note_lines.append('')
-        txt = "\n".join(note_lines) + "\n"
-        set_text(txt)
+        note_lines.append('')
+        set_lines(note_lines)
 
 
     def show_path():
@@ -1036,8 +2504,7 @@ def session():
         findlexer.set_regex(None)
         Data.showingNodes = True
         Data.showNodes()
-        lines =  Data.nodelines
-        set_text("\n".join(lines))
+        set_lines(Data.nodelines)
 
 
 
@@ -1046,25 +2513,30 @@ def session():
         findlexer.set_regex(None)
         Data.showingNodes = True
         Data.showNodes()
-        lines =  Data.nodelines
-        set_text("\n".join(lines))
+        set_lines(Data.nodelines)
 
 
     def toggle_leaves():
         Data.toggleShowLeaves()
         Data.showNodes()
-        set_text("\n".join(Data.nodelines))
+        set_lines(Data.nodelines)
 
 
     def toggle_branches():
         Data.toggleShowBranches()
         Data.showNodes()
-        set_text("\n".join(Data.nodelines))
+        set_lines(Data.nodelines)
 
 
     def show_update_info():
         set_text(check_update())
 
+
+    def show_stats():
+        lines = Data.statsLines(list(recent_commands), findlexer)
+        findlexer.set_regex(None)
+        set_lines(lines)
+
     execute = {
             'h': show_help,
             'c': copy_view,
@@ -1074,6 +2546,7 @@ def session():
             'b': toggle_branches,
             'r': refresh,
             'v': show_update_info,
+            's': show_stats,
             }
 
     # for commands without an argument
@@ -1085,10 +2558,13 @@ def session():
     @bindings.add('b', filter=is_not_typing)
     @bindings.add('v', filter=is_not_typing)
     @bindings.add('r', filter=is_not_typing)
+    @bindings.add('s', filter=is_not_typing)
     @bindings.add('y', filter=is_not_typing)
     def _(event):
         key = event.key_sequence[0].key
-        execute[key]()
+        with span(f"session: command {key}") as timer:
+            execute[key]()
+        recent_commands.append((key, timer.seconds))
 
 
     # for commands that need an argument
@@ -1104,13 +2580,13 @@ def session():
         "toggle entry_area"
         key = event.key_sequence[0].key
         active_key = key
-        # logger.debug(f"event row: {text_area.document.cursor_position_row}")
-        # logger.debug(f"event line: {text_area.document.current_line}")
-        # logger.debug(f"event ident: {ident_regex.search(text_area.document.current_line).group(0)}")
+        # logger.debug(f"event row: {lines_control.row}")
+        # logger.debug(f"event line: {lines_control.current_line}")
+        # logger.debug(f"event ident: {ident_regex.search(lines_control.current_line).group(0)}")
         instruction, command = dispatch.get(key, (None, None))
         if instruction:
             if active_key in ['a', 'i', 'e']:
-                m = ident_regex.search(text_area.document.current_line)
+                m = ident_regex.search(lines_control.current_line)
                 if m and m.group(0) != '1':
                     entry_window.text = m.group(0)
             ask_buffer.text = instruction
@@ -1125,39 +2601,58 @@ def session():
         " Quit. "
         event.app.exit()
 
+    @bindings.add('/', filter=is_not_typing)
+    @bindings.add('?', filter=is_not_typing)
+    def _(event):
+        " Start an incremental search forward or backward. "
+        lines_control.backward = event.key_sequence[0].key == '?'
+        lines_control.search_start = lines_control.row
+        search_buffer.reset()
+        application.layout.focus(search_buffer)
+
     @bindings.add(',', ',', filter=is_not_typing)
     def _(event):
-        search_state = get_app().current_search_state
-        search_state.text = ''
+        lines_control.search_text = ''
         findlexer.set_regex(None)
 
     @bindings.add('.', '.', filter=is_not_typing)
     def _(event):
-        search_state = get_app().current_search_state
-        text = search_state.text
+        text = lines_control.search_text
         if not text:
             return
         Data.find(text)
-        set_text("\n".join(Data.findlines))
+        set_lines(Data.findlines)
 
     # start with path view
     show_path()
 
+    render_started = None
+
+    def before_render(app):
+        nonlocal render_started
+        render_started = time.perf_counter()
+
+    def after_render(app):
+        # the prompt_toolkit layout, lexing and drawing
+        add_timing('session: render', time.perf_counter() - render_started)
+
     # create application.
     application = Application(
         layout=Layout(
             root_container,
-            focused_element=text_area,
+            focused_element=lines_control,
         ),
         key_bindings=bindings,
         enable_page_navigation_bindings=True,
         mouse_support=True,
-        style=style_obj,
+        style=get_style(),
+        before_render=before_render,
+        after_render=after_render,
         full_screen=True)
 
 
     def yaml_edit(application=application):
-        global session_edit, session_add, style_obj, tag_sort
+        global session_edit, session_add, user_style, style_obj, tag_sort
 
         hsh = {'filepath': cfg_path, 'linenum': '0'}
         editcmd = session_edit.format(**hsh)
@@ -1170,12 +2665,71 @@ def session():
         session_add = f"{yaml_data['edit_command']} {yaml_data['session_add_args']}"
         user_style = yaml_data['style']
         style_obj = Style.from_dict(user_style)
-        tag_sort = yaml_data.get('tag_sort', {})
+        if yaml_data.get('tag_sort', {}) != tag_sort:
+            tag_sort = yaml_data.get('tag_sort', {})
+            Data.sortTags()
+        Data.workers = yaml_data.get('scan_workers', 0)
+        set_watcher(yaml_data.get('watch', False))
         application.style = style_obj
 
     execute['y'] = yaml_edit
 
-    application.run()
+
+    def update_files(filepaths):
+        # runs in the event loop after the watcher reports changes
+        lines = lines_control.lines
+        if lines is Data.nodelines:
+            showing = 'nodes'
+        elif lines is Data.findlines and Data.findregex:
+            showing = 'find'
+        elif lines is Data.notelines:
+            showing = 'notes'
+        else:
+            # help, statistics or a message
+            showing = None
+        orig_mode = Data.mode
+        if not Data.getNodes(filepaths):
+            return
+        Data.setMode(orig_mode)
+        if showing is None:
+            return
+        row = lines_control.row
+        if showing == 'find':
+            Data.find(Data.findregex)
+            set_lines(Data.findlines)
+        elif showing == 'notes' and Data.reshowID():
+            set_lines(Data.notelines)
+        else:
+            Data.showNodes()
+            set_lines(Data.nodelines)
+        lines_control.row = min(row, max(len(lines_control.lines) - 1, 0))
+        application.invalidate()
+
+
+    def files_changed(filepaths):
+        # called from the watcher thread
+        application.loop.call_soon_threadsafe(update_files, filepaths)
+
+
+    watcher = None
+
+    def set_watcher(watch):
+        nonlocal watcher
+        if watch and not watcher:
+            from nts.watch import make_watcher
+            watcher = make_watcher(Data.rootdir, files_changed)
+            watcher.start()
+        elif watcher and not watch:
+            watcher.stop()
+            watcher = None
+
+    add_timing('session: setup', time.perf_counter() - started)
+    try:
+        application.run(pre_run=lambda: set_watcher(watch_files))
+    finally:
+        set_watcher(False)
+        if Data.cachedirty:
+            Data.saveCache()
 
 
 def main():
@@ -1218,12 +2772,30 @@ def main():
     parser.add_argument("-v",  "--version", help="check for an update to a later nts version",
                         action="store_true")
 
+    # --timings and --profile are applied by nts.__main__ before the scan
+    parser.add_argument("--timings", help="print the time taken by each phase, such as the scan, the tree display or find, when finished",
+                        action="store_true")
+
+    parser.add_argument("--profile", type=str, metavar="FILE", help="save a cProfile dump of the whole run in FILE for use with pstats, e.g. 'python -m pstats FILE'")
+
+    parser.add_argument("--memory", help="report the memory, traced by tracemalloc, used by the scan and by each of the main structures after showing the path and tag views and building the find index and then exit",
+                        action="store_true")
+
 
     if len(sys.argv)==1:
         parser.print_help()
         sys.exit(1)
 
     args = parser.parse_args()
+    if args.memory:
+        if scan_memory is None:
+            print("error: the scan was not traced")
+            return
+        notes = len(Data.notes) - len(Data.freeids)
+        for line in memory_lines(memory_usage(Data), scan_memory, notes):
+            print(line)
+        return
+
     mode = 'tags' if args.tags else 'path'
     Data.setMode(mode)
     Data.showNodes()
@@ -1246,13 +2818,8 @@ def main():
             Data.showNodes()
             Data.find(args.find)
             if not (args.add or args.edit or args.id):
-                lineno = 0
-                for line in Data.findlines:
-                    if lineno == 0:
-                        print(line)
-                    else:
-                        myprint(args.find, line)
-                    lineno += 1
+                print(Data.findlines[0])
+                myprint(args.find, Data.findlines[1:])
                 return
 
         if args.get:
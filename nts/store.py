@@ -0,0 +1,250 @@
+import os
+import json
+import sqlite3
+import logging
+
+from nts.nts import Note
+
+logger = logging.getLogger()
+
+# increment when the schema or the stored notes change - the database is
+# then rebuilt
+store_version = 4
+
+schema = """\
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    filepath TEXT UNIQUE NOT NULL,
+    nodeid TEXT NOT NULL,
+    mtime_ns INTEGER,
+    size INTEGER,
+    inode INTEGER,
+    errors TEXT
+);
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    linenum INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    tagstr TEXT NOT NULL,
+    body TEXT,
+    startbyte INTEGER NOT NULL,
+    endbyte INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS notes_file ON notes(file_id, linenum);
+CREATE INDEX IF NOT EXISTS notes_tagstr ON notes(tagstr);
+CREATE TABLE IF NOT EXISTS tags (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS note_tags (
+    note_id INTEGER NOT NULL REFERENCES notes(id) ON DELETE CASCADE,
+    tag_id INTEGER NOT NULL REFERENCES tags(id),
+    PRIMARY KEY (note_id, tag_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS note_tags_tag ON note_tags(tag_id);
+"""
+
+# the folded title and body of each note with rowid = notes.id
+fts_schema = """\
+CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+    title, body, tokenize='trigram case_sensitive 1'
+);
+"""
+
+
+def fts_query(query):
+    """
+    Return an FTS5 MATCH expression for a trigram query from
+    regex_trigrams.
+    """
+    if isinstance(query, str):
+        return '"{}"'.format(query.replace('"', '""'))
+    mode, queries = query
+    return "({})".format(f" {mode.upper()} ".join([fts_query(x) for x in queries]))
+
+
+class NoteStore(object):
+    """
+    A SQLite mirror of the parsed notes kept in sync with the note files
+    by their fingerprints. Notes are identified, as in NodeData, by the
+    key (filepath, linenum).
+    """
+
+    def __init__(self, dbpath, fold):
+        self.dbpath = dbpath
+        self.fold = fold # the folding used for the trigram queries
+        self.connection = self.connect()
+        self.fps = {
+                x[0]: tuple(x[1:]) for x in self.connection.execute(
+                    "SELECT filepath, mtime_ns, size, inode FROM files")
+                }
+
+
+    def connect(self):
+        """
+        Open the database, recreating it if it is corrupt or was created
+        by another version.
+        """
+        try:
+            connection = self.open()
+            row = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if row and row[0] == str(store_version):
+                return connection
+            logger.info(f"rebuilding store {self.dbpath}")
+            connection.close()
+        except sqlite3.DatabaseError as e:
+            logger.warning(f"rebuilding corrupt store {self.dbpath}: {e}")
+        for path in [self.dbpath, f"{self.dbpath}-wal", f"{self.dbpath}-shm"]:
+            if os.path.exists(path):
+                os.remove(path)
+        return self.open()
+
+
+    def open(self):
+        connection = sqlite3.connect(self.dbpath)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.execute("PRAGMA foreign_keys = ON")
+        connection.executescript(schema)
+        try:
+            connection.executescript(fts_schema)
+            self.fts = True
+        except sqlite3.OperationalError as e:
+            # fts5 or the trigram tokenizer (sqlite 3.34) is unavailable
+            logger.info(f"full text search is unavailable: {e}")
+            self.fts = False
+        with connection:
+            connection.execute("INSERT OR IGNORE INTO meta VALUES ('version', ?)", (str(store_version), ))
+        return connection
+
+
+    def close(self):
+        self.connection.close()
+
+
+    def cachedNotes(self):
+        """
+        Return filepath -> (fingerprint, notes, errors) for the stored
+        files in the format used by the NodeData parse cache but with
+        Notes without bodies.
+        """
+        cached = {x: (fp, [], []) for x, fp in self.fps.items()}
+        for filepath, errors in self.connection.execute(
+                "SELECT filepath, errors FROM files WHERE errors IS NOT NULL"):
+            cached[filepath][2].extend([tuple(x) for x in json.loads(errors)])
+        rows = self.connection.execute("""
+            SELECT files.filepath, notes.title, notes.linenum, notes.tagstr,
+                notes.startbyte, notes.endbyte
+            FROM notes JOIN files ON files.id = notes.file_id
+            ORDER BY files.id, notes.linenum""")
+        for filepath, title, linenum, tagstr, start, end in rows:
+            # title is stored as '+ title' and tagstr as ' (tag, tag)'
+            tags = tagstr[2:-1].split(', ') if tagstr else []
+            cached[filepath][1].append(Note(title[2:], tags, filepath, linenum, start, end))
+        return cached
+
+
+    def sync(self, changed, notes, errors, filekeys, present):
+        """
+        Write the notes for the changed files whose fingerprints differ
+        from the stored ones and delete the files that are not present.
+        changed is a list of (filepath, fingerprint), notes maps each of
+        these filepaths to its notes from getnotes and errors maps those
+        with parse errors to the errors.
+        """
+        with self.connection:
+            for filepath, fp in changed:
+                if fp is not None and self.fps.get(filepath) == fp:
+                    continue
+                self.deleteFile(filepath)
+                if fp is None:
+                    continue
+                self.insertFile(filepath, filekeys[filepath], fp, notes[filepath], errors.get(filepath))
+            for filepath in [x for x in self.fps if x not in present]:
+                self.deleteFile(filepath)
+            self.connection.execute(
+                    "DELETE FROM tags WHERE id NOT IN (SELECT tag_id FROM note_tags)")
+
+
+    def deleteFile(self, filepath):
+        if self.fts:
+            self.connection.execute("""
+                DELETE FROM notes_fts WHERE rowid IN (
+                    SELECT notes.id FROM notes JOIN files ON files.id = notes.file_id
+                    WHERE files.filepath = ?)""", (filepath, ))
+        self.connection.execute("DELETE FROM files WHERE filepath = ?", (filepath, ))
+        self.fps.pop(filepath, None)
+
+
+    def insertFile(self, filepath, nodeid, fp, notes, errors=None):
+        execute = self.connection.execute
+        fileid = execute(
+                "INSERT INTO files (filepath, nodeid, mtime_ns, size, inode, errors) VALUES (?, ?, ?, ?, ?, ?)",
+                (filepath, nodeid) + tuple(fp) + (json.dumps(errors) if errors else None, )).lastrowid
+        for note in notes:
+            titlestr = note.titlestr
+            tagstr = note.tagstr
+            body = note.body
+            noteid = execute(
+                    "INSERT INTO notes (file_id, linenum, title, tagstr, body, startbyte, endbyte) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (fileid, note.linenum, titlestr, tagstr, body, note.start, note.end)).lastrowid
+            for tag in (note.tags if note.tags else ['~']):
+                execute("INSERT OR IGNORE INTO tags (name) VALUES (?)", (tag, ))
+                execute("""
+                    INSERT OR IGNORE INTO note_tags
+                    SELECT ?, id FROM tags WHERE name = ?""", (noteid, tag))
+            if self.fts:
+                execute("INSERT INTO notes_fts (rowid, title, body) VALUES (?, ?, ?)",
+                        (noteid, self.fold(f"{titlestr}{tagstr}"), self.fold(body) if body else ""))
+        self.fps[filepath] = tuple(fp)
+
+
+    def find(self, regex, query=None):
+        """
+        Yield (key, lines) for the notes with a line matching the compiled
+        regex where lines are the title and body lines as from
+        Note.lines. When query, a trigram query from
+        regex_trigrams, is given and full text search is available, only
+        the notes containing the required trigrams are checked.
+        """
+        sql = """
+            SELECT files.filepath, notes.linenum, notes.title, notes.tagstr, notes.body
+            FROM notes JOIN files ON files.id = notes.file_id"""
+        args = ()
+        if query is not None and self.fts:
+            sql += " WHERE notes.id IN (SELECT rowid FROM notes_fts WHERE notes_fts MATCH ?)"
+            args = (fts_query(query), )
+        for filepath, linenum, title, tagstr, body in self.connection.execute(sql, args):
+            lines = [f"{title}{tagstr}"]
+            if body is not None:
+                lines.extend(body.split("\n"))
+            for line in lines:
+                if regex.search(line):
+                    yield (filepath, linenum), lines
+                    break
+
+
+    def joinKeys(self, mode, regxs):
+        """
+        Return the keys of the notes whose tag strings satisfy the JOIN
+        given by mode and the compiled regxs as in NodeData.setJoin. Each
+        regex is only run once for each distinct tag string.
+        """
+        tagstrs = []
+        for (tagstr, ) in self.connection.execute(
+                "SELECT DISTINCT tagstr FROM notes WHERE tagstr != ''"):
+            matches = [r.search(tagstr) is not None for r in regxs]
+            if (all(matches) if mode == 'and' else any(matches)):
+                tagstrs.append(tagstr)
+        keys = set()
+        for tagstr in tagstrs:
+            keys.update(self.connection.execute("""
+                SELECT files.filepath, notes.linenum
+                FROM notes JOIN files ON files.id = notes.file_id
+                WHERE notes.tagstr = ?""", (tagstr, )))
+        return keys
@@ -0,0 +1,226 @@
+"""
+The prompt_toolkit lexer and control used to show lines in session mode.
+These are kept apart from nts.nts so that the command line interface does
+not need to import prompt_toolkit.
+"""
+import re
+
+from prompt_toolkit.application.current import get_app
+from prompt_toolkit.data_structures import Point
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.filters import Condition
+from prompt_toolkit.layout.controls import UIControl, UIContent
+from prompt_toolkit.lexers import Lexer
+from prompt_toolkit.mouse_events import MouseEventType
+
+# the number of lines whose highlighted fragments NTSLexer keeps
+lexer_cache_size = 10000
+
+
+def get_matches(pattern, line, lineno=None):
+    if not pattern or lineno == 0:
+        return [("class:plain", line)]
+    if isinstance(pattern, str):
+        pattern = re.compile(pattern, re.IGNORECASE)
+    parts = []
+    last_end = 0
+    for match in pattern.finditer(line):
+        s = match.start()
+        e = match.end()
+        if s > last_end:
+            parts.append(("class:plain", line[last_end:s]))
+        parts.append(("class:highlighted", line[s:e]))
+        last_end = e
+    if line[last_end:]:
+        parts.append(("class:plain", line[last_end:]))
+    return parts
+
+
+class NTSLexer(Lexer):
+    def __init__(self, regex=None):
+        self.regex = None
+        # the compiled pattern for the regex and search text last used
+        # by lex_lines and the fragments it has produced for lines
+        self.patternkey = (None, None)
+        self.pattern = None
+        self.fragments = {} # line -> fragments
+        self.hits = 0 # lines lexed from fragments
+        self.misses = 0
+        self.set_regex(regex)
+
+    def set_regex(self, regex):
+        if regex in ['', None]:
+            self.regex = None
+        else:
+            self.regex = regex
+        # logger.debug(f"lexer regex: '{self.regex}'")
+        self.compile(None)
+
+    def compile(self, search):
+        """
+        Compile the pattern combining the regex and the search text unless
+        it is the one already compiled, clearing the fragments if not.
+        """
+        if (self.regex, search) == self.patternkey:
+            return
+        self.patternkey = (self.regex, search)
+        self.fragments = {}
+        pattern = self.regex
+        if search:
+            search = re.escape(search)
+            pattern = f"{pattern}|{search}" if pattern else search
+        self.pattern = re.compile(pattern, re.IGNORECASE) if pattern else None
+
+    def lex_document(self, document):
+        return self.lex_lines(document.lines)
+
+    def lex_lines(self, lines, search=None):
+        """
+        Return a function that lexes a line of lines by its number,
+        highlighting the matches for the regex and for the search text.
+        The fragments for each line are kept until the pattern changes.
+        """
+        self.compile(search if search else None)
+        pattern = self.pattern
+        fragments = self.fragments
+
+        def get_line(lineno):
+            line = lines[lineno]
+            if pattern is None or lineno == 0:
+                return [("class:plain", line)]
+            parts = fragments.get(line)
+            if parts is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                if len(fragments) >= lexer_cache_size:
+                    fragments.clear()
+                parts = fragments[line] = get_matches(pattern, line)
+            return parts
+
+        return get_line
+
+
+class LinesControl(UIControl):
+    """
+    A read-only view of a list of lines such as NodeData.nodelines. Only
+    the lines that are visible in the window are lexed and rendered, so
+    the cost of a redraw does not depend upon the number of lines.
+    """
+    def __init__(self, lexer):
+        self.lexer = lexer
+        self.lines = []
+        self.row = 0 # the cursor line
+        self.search_text = ''
+        self.search_start = 0 # the cursor line when the search began
+        self.backward = False
+        self.key_bindings = self.get_bindings()
+
+    def set_lines(self, lines):
+        self.lines = lines
+        self.row = 0
+
+    @property
+    def text(self):
+        return "\n".join(self.lines)
+
+    @property
+    def current_line(self):
+        return self.lines[self.row] if self.row < len(self.lines) else ''
+
+    def is_focusable(self):
+        return True
+
+    def create_content(self, width, height):
+        lines = self.lines if self.lines else ['']
+        self.row = max(0, min(self.row, len(lines) - 1))
+        return UIContent(
+                get_line=self.lexer.lex_lines(lines, self.search_text),
+                line_count=len(lines),
+                cursor_position=Point(x=0, y=self.row),
+                )
+
+    def move_cursor_down(self):
+        self.row = min(self.row + 1, max(len(self.lines) - 1, 0))
+
+    def move_cursor_up(self):
+        self.row = max(self.row - 1, 0)
+
+    def move_page(self, pages):
+        info = get_app().layout.current_window.render_info
+        height = info.window_height if info else 1
+        self.row = max(0, min(self.row + pages * max(height - 1, 1), len(self.lines) - 1))
+
+    def search(self, text, backward=False, start=None):
+        """
+        Move the cursor to the first line from start, wrapping around,
+        that contains text ignoring case. Return True if found.
+        """
+        if not text or not self.lines:
+            return False
+        start = self.row if start is None else start
+        text = text.lower()
+        step = -1 if backward else 1
+        for i in range(len(self.lines)):
+            row = (start + step * i) % len(self.lines)
+            if text in self.lines[row].lower():
+                self.row = row
+                return True
+        return False
+
+    def mouse_handler(self, mouse_event):
+        if mouse_event.event_type == MouseEventType.MOUSE_UP:
+            self.row = mouse_event.position.y
+            get_app().layout.focus(self)
+            return None
+        # let the window handle scrolling
+        return NotImplemented
+
+    def get_key_bindings(self):
+        return self.key_bindings
+
+    def get_bindings(self):
+        bindings = KeyBindings()
+        searched = Condition(lambda: bool(self.search_text))
+
+        @bindings.add('up')
+        @bindings.add('c-p')
+        def _(event):
+            self.move_cursor_up()
+
+        @bindings.add('down')
+        @bindings.add('c-n')
+        def _(event):
+            self.move_cursor_down()
+
+        @bindings.add('pageup')
+        def _(event):
+            self.move_page(-1)
+
+        @bindings.add('pagedown')
+        def _(event):
+            self.move_page(1)
+
+        @bindings.add('home')
+        @bindings.add('c-home')
+        def _(event):
+            self.row = 0
+
+        @bindings.add('end')
+        @bindings.add('c-end')
+        def _(event):
+            self.row = max(len(self.lines) - 1, 0)
+
+        @bindings.add('n', filter=searched)
+        def _(event):
+            "continue the search in the same direction"
+            step = -1 if self.backward else 1
+            self.search(self.search_text, self.backward, self.row + step)
+
+        @bindings.add('N', filter=searched)
+        def _(event):
+            "continue the search in the reverse direction"
+            step = 1 if self.backward else -1
+            self.search(self.search_text, not self.backward, self.row + step)
+
+        return bindings
@@ -0,0 +1,207 @@
+import os
+import sys
+import abc
+import ctypes
+import ctypes.util
+import fnmatch
+import select
+import struct
+import threading
+import logging
+
+logger = logging.getLogger()
+
+# inotify event masks from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+watch_mask = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+        IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+event_header = struct.Struct('iIII') # wd, mask, cookie, len
+
+
+def is_notefile(name):
+    return fnmatch.fnmatch(name, "[!.]*.txt")
+
+
+class Watcher(abc.ABC):
+    """
+    Watch the directories below rootdir from a daemon thread and call
+    callback(filepaths) once changes have stopped arriving for delay
+    seconds. filepaths is the set of changed note files or None if the
+    directories have changed and rootdir needs to be walked again.
+    """
+
+    def __init__(self, rootdir, callback, delay=0.25):
+        self.rootdir = rootdir
+        self.callback = callback
+        self.delay = delay
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='nts-watch', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        pending = set()
+        rescan = False
+        while not self.stopped.is_set():
+            # idle waits are bounded so that stop is noticed
+            changes = self.wait(self.delay if pending or rescan else 1.0)
+            if changes:
+                for filepath in changes:
+                    if filepath is None:
+                        rescan = True
+                    else:
+                        pending.add(filepath)
+            elif pending or rescan:
+                try:
+                    self.callback(None if rescan else pending)
+                except Exception as e:
+                    logger.error(f"watcher callback failed: {e}")
+                pending = set()
+                rescan = False
+        self.close()
+
+    @abc.abstractmethod
+    def wait(self, timeout):
+        """
+        Return the changes seen within timeout seconds, a list of note
+        file paths with None for a directory change.
+        """
+
+    def close(self):
+        pass
+
+
+class PollWatcher(Watcher):
+    """
+    Find changes by comparing snapshots of the directories and the
+    modification times and sizes of the note files taken every interval
+    seconds.
+    """
+
+    def __init__(self, rootdir, callback, delay=0.25, interval=1.0):
+        super().__init__(rootdir, callback, delay)
+        self.interval = interval
+        self.snapshot = self.take()
+
+    def take(self):
+        dirs = set()
+        files = {}
+        for root, dirnames, filenames in os.walk(self.rootdir):
+            dirs.add(root)
+            for name in filenames:
+                if not is_notefile(name):
+                    continue
+                filepath = os.path.join(root, name)
+                try:
+                    st = os.stat(filepath)
+                except OSError:
+                    continue
+                files[filepath] = (st.st_mtime_ns, st.st_size, st.st_ino)
+        return dirs, files
+
+    def wait(self, timeout):
+        if self.stopped.wait(max(timeout, self.interval)):
+            return []
+        dirs, files = self.take()
+        old_dirs, old_files = self.snapshot
+        self.snapshot = (dirs, files)
+        changes = [x for x in files if files[x] != old_files.get(x)]
+        changes.extend([x for x in old_files if x not in files])
+        if dirs != old_dirs:
+            changes.append(None)
+        return changes
+
+
+class InotifyWatcher(Watcher):
+    """
+    Find changes using inotify, watching each directory below rootdir.
+    """
+
+    def __init__(self, rootdir, callback, delay=0.25):
+        super().__init__(rootdir, callback, delay)
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths = {} # watch descriptor -> directory
+        try:
+            for root, dirs, files in os.walk(rootdir):
+                self.add(root)
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def add(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), watch_mask)
+        if wd < 0:
+            # e.g. the user limit on the number of watches has been reached
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self.paths[wd] = path
+
+    def wait(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        changes = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = event_header.unpack_from(data, offset)
+            offset += event_header.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                changes.append(None)
+                continue
+            if mask & IN_IGNORED:
+                self.paths.pop(wd, None)
+                continue
+            path = self.paths.get(wd)
+            if path is None:
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                changes.append(None)
+            elif mask & IN_ISDIR:
+                changes.append(None)
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    try:
+                        for root, dirs, files in os.walk(os.path.join(path, name)):
+                            self.add(root)
+                    except OSError as e:
+                        logger.warning(f"not watching {path}: {e}")
+            elif is_notefile(name):
+                changes.append(os.path.join(path, name))
+        return changes
+
+    def close(self):
+        os.close(self.fd)
+
+
+def make_watcher(rootdir, callback):
+    """
+    Return an inotify watcher on Linux or, if inotify is unavailable, a
+    polling watcher for rootdir.
+    """
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(rootdir, callback)
+        except (OSError, AttributeError) as e:
+            logger.info(f"inotify is unavailable, polling instead: {e}")
+    return PollWatcher(rootdir, callback)
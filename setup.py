@@ -25,7 +25,6 @@ VERSION = version
 REQUIRED = [
         "prompt-toolkit>=3.0.24",
         "ruamel.yaml>=0.15.88",
-        "anytree>=2.8.0"
 ]
 
 # What packages are optional?
@@ -0,0 +1,124 @@
+"""
+Checks that the parse cache written by saveCache gives the same notes,
+trees and parse errors as parsing the files and that a stale or damaged
+cache is ignored.
+"""
+import os
+import pickle
+
+import pytest
+
+import nts.nts as nts
+
+files = {
+    'a.txt': ["+ first (red)", "    one", "+ second", "    two"],
+    'sub/b.txt': ["leading text", "+ third (red, blue)", "", "    three", ""],
+    'sub/c.txt': ["+ good", "+ bad (unclosed", "    body"],
+    }
+
+
+@pytest.fixture
+def rootdir(tmp_path):
+    for name, lines in files.items():
+        path = tmp_path / 'data' / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("\n".join(lines) + "\n", encoding=nts.file_encoding)
+    return str(tmp_path / 'data')
+
+
+@pytest.fixture
+def cachefile(tmp_path):
+    return str(tmp_path / 'cache.pickle')
+
+
+def state(Data):
+    """
+    Return the notes, parse errors and the lines of both views.
+    """
+    notes = sorted([(x.key, x.lines(), x.tags, x.start, x.end) for x in Data.notes if x is not None])
+    lines = {}
+    for mode in ['path', 'tags']:
+        Data.setMode(mode)
+        Data.showNodes()
+        lines[mode] = list(Data.nodelines)
+    return notes, dict(Data.parseerrors), lines
+
+
+def test_round_trip(rootdir, cachefile):
+    parsed = nts.NodeData(rootdir, cachefile)
+    assert parsed.lastscan['parsed'] == len(files)
+    assert os.path.isfile(cachefile)
+    cached = nts.NodeData(rootdir, cachefile)
+    assert cached.lastscan['parsed'] == 0
+    assert cached.lastscan['cached'] == len(files)
+    assert state(cached) == state(parsed)
+
+
+def test_changed_file_is_parsed(rootdir, cachefile):
+    nts.NodeData(rootdir, cachefile)
+    with open(os.path.join(rootdir, 'a.txt'), 'a') as fo:
+        fo.write("+ added\n")
+    cached = nts.NodeData(rootdir, cachefile)
+    assert cached.lastscan['parsed'] == 1
+    assert state(cached) == state(nts.NodeData(rootdir))
+
+
+def test_parse_errors_are_replayed(rootdir, cachefile, capsys):
+    nts.NodeData(rootdir, cachefile)
+    cold = capsys.readouterr().out
+    cached = nts.NodeData(rootdir, cachefile)
+    warm = capsys.readouterr().out
+    assert cached.lastscan['parsed'] == 0
+    assert "Error failed to match: '+ bad (unclosed\n'\nin filepath" in cold
+    assert warm == cold
+    assert cached.parseerrors == {os.path.join(rootdir, 'sub', 'c.txt'): [(1, '+ bad (unclosed')]}
+
+
+@pytest.mark.parametrize('damage', ['truncated', 'garbage', 'empty', 'not a dict'])
+def test_damaged_cache_is_ignored(rootdir, cachefile, damage):
+    nts.NodeData(rootdir, cachefile)
+    with open(cachefile, 'rb') as fo:
+        data = fo.read()
+    with open(cachefile, 'wb') as fo:
+        if damage == 'truncated':
+            fo.write(data[:len(data) // 2])
+        elif damage == 'garbage':
+            fo.write(b'not a pickle')
+        elif damage == 'not a dict':
+            pickle.dump(['files'], fo)
+    Data = nts.NodeData(rootdir, cachefile)
+    assert Data.lastscan['parsed'] == len(files)
+    assert state(Data) == state(nts.NodeData(rootdir))
+    # and the cache is written again
+    assert nts.NodeData(rootdir, cachefile).lastscan['parsed'] == 0
+
+
+def test_other_version_is_ignored(rootdir, cachefile, monkeypatch):
+    nts.NodeData(rootdir, cachefile)
+    monkeypatch.setattr(nts, 'cache_version', nts.cache_version + 1)
+    Data = nts.NodeData(rootdir, cachefile)
+    assert Data.lastscan['parsed'] == len(files)
+    assert state(Data) == state(nts.NodeData(rootdir))
+
+
+def test_other_rootdir_is_ignored(rootdir, cachefile, tmp_path):
+    other = tmp_path / 'other'
+    other.mkdir()
+    (other / 'x.txt').write_text("+ other\n")
+    nts.NodeData(str(other), cachefile)
+    Data = nts.NodeData(rootdir, cachefile)
+    assert Data.lastscan['parsed'] == len(files)
+
+
+def test_session_saves_when_asked(rootdir, cachefile):
+    Data = nts.NodeData(rootdir, cachefile)
+    Data.sessionMode = True
+    saved = os.stat(cachefile).st_mtime_ns
+    with open(os.path.join(rootdir, 'a.txt'), 'a') as fo:
+        fo.write("+ added\n")
+    Data.getNodes()
+    assert Data.cachedirty
+    assert os.stat(cachefile).st_mtime_ns == saved
+    Data.saveCache()
+    assert not Data.cachedirty
+    assert nts.NodeData(rootdir, cachefile).lastscan['parsed'] == 0
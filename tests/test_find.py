@@ -0,0 +1,152 @@
+"""
+Checks that the candidates given by the trigram index never
+drop a note that the find regex matches. Each find is compared with a
+scan of every note.
+"""
+import os
+import re
+
+import pytest
+
+import nts.nts as nts
+
+notes = {
+    'animals.txt': [
+        "+ cat and dog (pets)",
+        "    a catfish and a dogfish swim",
+        "+ colour (spelling)",
+        "    the colour grey",
+        "+ color (spelling, us)",
+        "    the color gray",
+        "+ big apple pie",
+        "    foobarbaz",
+        "+ apple pie",
+        "    foobaz",
+        ],
+    'mixed.txt': [
+        "+ HeLLo World (greeting)",
+        "    xabcy xabcabcy",
+        "+ plain xy",
+        "+ phone 555-1234",
+        "    hallo hello hullo",
+        "+ kelvin Kelvin",
+        "    ſun and İstanbul and ındigo",
+        "+ café naïve über",
+        "    straße STRASSE",
+        "+ x+y a.b",
+        "    abab abababc abc xyz foobar",
+        "+ short",
+        "    a b ab ba",
+        "+ nested",
+        "    abefij cdefij ghij",
+        "    the end",
+        ],
+    }
+
+finds = [
+    # alternation
+    "cat|dog", "(cat|dog)fish", "catfish|x", "gr(a|e)y", "((ab|cd)ef|gh)ij",
+    # optional groups and repeats
+    "colou?r", "(big )?apple pie", "foo(bar)?baz", "x(abc)*y", "x(abc)+y",
+    "x(abc){0,2}y", "foo(bar|)baz",
+    "(ab){2}c", "ab{0}c", "(ab)\\1",
+    # character classes
+    "gr[ae]y", "[a-z]+ing", "\\d{3}-\\d{4}", "h.llo", "\\bwor", "[^a]bc",
+    # case folding
+    "HELLO", "hello world", "kelvin", "KELVIN", "sun", "istanbul", "indigo",
+    "CAFÉ", "straße", "strasse", "(?-i:Hello)", "(?-i:hello)",
+    # anchors, escapes and lookarounds
+    "^\\+ short", "end$", "x\\+y", "a\\.b", "foo(?=bar)", "(?!abc)xyz",
+    # plain words and very short patterns
+    "cat dog", "own fox", "a", "ab", "a b", "é", "über", "zz",
+    ]
+
+
+def write(rootdir, files):
+    for name, lines in files.items():
+        with open(os.path.join(rootdir, name), 'w', encoding=nts.file_encoding) as fo:
+            fo.write("\n".join(lines) + "\n")
+
+
+def scanned(Data, find):
+    """
+    Return the keys of the notes with a line matching find by checking
+    every note.
+    """
+    regex = re.compile(find, re.IGNORECASE)
+    return {x.key for x in Data.notes if x is not None and any(regex.search(y) for y in x.lines())}
+
+
+def pruned(Data, find):
+    """
+    Return the keys of the notes with a line matching find among the
+    candidates from the indexes.
+    """
+    regex = re.compile(find, re.IGNORECASE)
+    keys = set()
+    for noteid in Data.findCandidates(find):
+        note = Data.notes[noteid]
+        if any(regex.search(x) for x in note.lines()):
+            keys.add(note.key)
+    return keys
+
+
+@pytest.fixture
+def Data(tmp_path):
+    write(tmp_path, notes)
+    return nts.NodeData(str(tmp_path))
+
+
+@pytest.mark.parametrize('find', finds)
+def test_candidates(Data, find):
+    assert pruned(Data, find) == scanned(Data, find)
+
+
+@pytest.mark.parametrize('find', ["cat|dog", "colou?r", "gr[ae]y", "HELLO", "ab"])
+def test_find_lines(Data, find):
+    Data.setMode('path')
+    Data.showNodes()
+    Data.find(find)
+    # the title lines are followed by the ids
+    titles = {x.rsplit(' ', 1)[0] for x in Data.findlines[1:] if x.startswith('+ ')}
+    assert titles == {Data.getNote(*x).lines()[0] for x in scanned(Data, find)}
+
+
+def test_candidates_after_changes(Data, tmp_path):
+    # build the indexes and then change, add and remove files
+    assert pruned(Data, "cat|dog") == scanned(Data, "cat|dog")
+    write(tmp_path, {
+            'animals.txt': ["+ dog only", "    a grey dogfish"],
+            'added.txt': ["+ new cat (pets)", "    colour"],
+            })
+    os.remove(tmp_path / 'mixed.txt')
+    Data.getNodes()
+    for find in finds:
+        assert pruned(Data, find) == scanned(Data, find), find
+
+
+def test_body_cache_reads(tmp_path, monkeypatch):
+    write(tmp_path, notes)
+    reads = []
+    getnotes = nts.getnotes
+    def counted(filepath, data=None):
+        reads.append(os.path.basename(filepath))
+        return getnotes(filepath, data)
+    monkeypatch.setattr(nts, 'getnotes', counted)
+    # room for the bodies of animals.txt but not of both files
+    small = sum([len(x) for x in notes['animals.txt']]) * 4
+    for bodycache, again in [(2**20, []), (small, ['mixed.txt'])]:
+        Data = nts.NodeData(str(tmp_path), bodycache=bodycache)
+        Data.setMode('path')
+        Data.showNodes()
+        full = nts.NodeData(str(tmp_path))
+        full.setMode('path')
+        full.showNodes()
+        reads.clear()
+        for find in ["cat|dog", "colou?r", "ab"]:
+            Data.find(find)
+            full.find(find)
+            assert Data.findlines == full.findlines
+        # each file is read once by the first find and then only those
+        # whose bodies did not fit in the cache
+        assert reads == ['animals.txt', 'mixed.txt'] + again * 2
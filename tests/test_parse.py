@@ -0,0 +1,103 @@
+"""
+Checks that the streaming getnotes gives the same notes and reports the
+same parse errors as the parser it replaced, which read all the lines
+first and printed the errors itself.
+"""
+import os
+
+import pytest
+
+import nts.nts as nts
+
+
+def old_getnotes(filepath):
+    """
+    The parser before getnotes streamed the lines, returning
+    [title, tags, linenum, body] lists.
+    """
+    notes = []
+    with open(filepath, 'r', encoding=nts.file_encoding) as fo:
+        lines = fo.readlines()
+
+    note = [] # [title, [tags], linenum, [body]]
+    body = []
+    linenum = -1
+    for line in lines:
+        linenum += 1
+        if line and line[0] == "+" and not nts.note_regex.match(line):
+            print(f"Error failed to match: '{line}'\nin filepath: '{filepath}'")
+        if nts.note_regex.match(line):
+            if note:
+                if body and not body[-1]:
+                    body = body[:-1]
+                note.append(body)
+                notes.append(note)
+            note = []
+            body = []
+            m = nts.note_regex.match(line)
+            title = m.group(1).strip() if m and m.group(1) else line.strip()
+            tags = [x.strip() for x in m.group(3).split(',')] if m and m.group(3) else []
+            note = [title, tags, linenum]
+        else:
+            body.append(line.rstrip())
+    if note:
+        if body and not body[-1]:
+            body = body[:-1]
+        note.append(body)
+        notes.append(note)
+    return notes
+
+
+texts = {
+    'good': "+ first (red, blue)\n    one\n\n    two\n+ second\n    three\n",
+    'leading': "leading text\n\n  more\n+ first\n    one\n",
+    'blank lines': "\n\n+ first\n\n    one\n\n\n+ second\n\n+ third\n    two\n\n",
+    'errors': "+ good\n+ bad (unclosed\n    body\n+\n+ another (x)\n+ (only tags)\n  + indented\n",
+    'error first': "+ bad (\n+ good\n    body  \n+ bad again )  \n",
+    'headings': "# heading (tag)\n    one\n#not a heading\n+ note\n",
+    'no notes': "just text\n\n+bad\n",
+    'no final newline': "+ first\n    one\n+ second\n    two",
+    'crlf': "+ first (a)\r\n    one\r\n\r\n+ second\r\n    two\r\n",
+    'unicode': "+ café (naïve)\n    straße\n+ über\n    ſun\n",
+    'empty': "",
+    }
+
+
+@pytest.fixture(params=sorted(texts))
+def filepath(request, tmp_path):
+    path = tmp_path / 'note.txt'
+    with open(path, 'w', encoding=nts.file_encoding, newline='') as fo:
+        fo.write(texts[request.param])
+    return str(path)
+
+
+def test_same_notes(filepath):
+    notes, errors = nts.getnotes(filepath)
+    new = [[x.title, list(x.tags), x.linenum, x.lines()[1:]] for x in notes]
+    assert new == old_getnotes(filepath)
+
+
+def test_same_errors(filepath, capsys):
+    old_getnotes(filepath)
+    old = capsys.readouterr().out
+    Data = nts.NodeData(os.path.dirname(filepath))
+    assert capsys.readouterr().out == old
+    with open(filepath, 'r', encoding=nts.file_encoding) as fo:
+        lines = fo.read().split("\n")
+    expected = [(i, x) for i, x in enumerate(lines) if x.startswith('+') and not nts.note_regex.match(x)]
+    assert Data.parseerrors.get(filepath, []) == expected
+
+
+def test_offsets(filepath):
+    notes, errors = nts.getnotes(filepath)
+    with open(filepath, 'rb') as fo:
+        data = fo.read()
+    lines = data.decode(nts.file_encoding).splitlines()
+    for note in notes:
+        # each note's bytes begin with its title line
+        text = data[note.start:note.end].decode(nts.file_encoding)
+        assert text.splitlines()[0] == lines[note.linenum]
+    # and the same notes are parsed from the bytes
+    fromdata, dataerrors = nts.getnotes(filepath, data)
+    assert dataerrors == errors
+    assert [(x.lines(), x.start, x.end) for x in fromdata] == [(x.lines(), x.start, x.end) for x in notes]
@@ -0,0 +1,93 @@
+"""
+Checks that the trees patched by incremental calls of getNodes show the
+same lines as those built by a fresh NodeData for the same files.
+"""
+import os
+import random
+
+import pytest
+
+import nts.nts as nts
+
+# tags whose sort keys are the same apart from the tie-break on names
+tags = ['a b', 'ab', 'b x', '~x', 'now', 'next', 'red', 'red blue']
+
+
+def write(rootdir, name, lines):
+    path = os.path.join(rootdir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding=nts.file_encoding) as fo:
+        fo.write("\n".join(lines) + "\n")
+
+
+def random_file(rnd):
+    lines = []
+    for i in range(rnd.randint(0, 4)):
+        chosen = rnd.sample(tags, rnd.randint(0, 2))
+        tagstr = f" ({', '.join(chosen)})" if chosen else ""
+        lines.extend([f"+ note {i}{tagstr}", f"    body {rnd.randint(0, 9)}"])
+    return lines
+
+
+def shown(Data):
+    """
+    Return the lines of the path and tags views.
+    """
+    lines = {}
+    for mode in ['path', 'tags']:
+        Data.setMode(mode)
+        Data.showNodes()
+        lines[mode] = list(Data.nodelines)
+    return lines
+
+
+@pytest.fixture(autouse=True)
+def tag_sort(monkeypatch):
+    monkeypatch.setattr(nts, 'tag_sort', {'b': '~', 'now': '!', 'next': '#'})
+    monkeypatch.setenv('COLUMNS', '100')
+
+
+@pytest.mark.parametrize('seed', range(8))
+def test_incremental_matches_fresh(tmp_path, seed):
+    rnd = random.Random(seed)
+    names = [f"d{i % 2}/f{i}.txt" for i in range(6)]
+    for name in names:
+        write(tmp_path, name, random_file(rnd))
+    Data = nts.NodeData(str(tmp_path))
+    Data.sessionMode = True
+    for step in range(6):
+        changed = rnd.sample(names, 2)
+        for name in changed:
+            write(tmp_path, name, random_file(rnd))
+        # both the watcher's and the full rescans
+        if step % 2:
+            Data.getNodes([os.path.join(tmp_path, x) for x in changed])
+        else:
+            Data.getNodes()
+        fresh = nts.NodeData(str(tmp_path))
+        fresh.sessionMode = True
+        assert shown(Data) == shown(fresh)
+
+
+def test_reshow_note(tmp_path):
+    # showID expects the notes to be in a data directory
+    rootdir = str(tmp_path / 'data')
+    write(rootdir, "f.txt", ["+ first", "    one", "+ second", "    two"])
+    Data = nts.NodeData(rootdir)
+    Data.sessionMode = True
+    Data.setMode('path')
+    Data.showNodes()
+    ident = [x for x, y in Data.id2info.items() if y[1] == 2][0]
+    idstr = "-".join([str(x) for x in ident])
+    Data.showID(idstr)
+    assert Data.notelines[1:] == ["+ second", "    two"]
+    # a changed note is shown again with the same id
+    write(rootdir, "f.txt", ["+ first", "    one", "+ second", "    two and more"])
+    Data.getNodes()
+    assert Data.reshowID()
+    assert Data.notelines[1:] == ["+ second", "    two and more"]
+    # and the tree when the id no longer belongs to a note
+    write(rootdir, "f.txt", ["+ first", "    one"])
+    Data.getNodes()
+    assert not Data.reshowID()
+    assert Data.showingNodes
@@ -0,0 +1,104 @@
+"""
+Checks the prefixes given by Tree.render, which replaced anytree's
+RenderTree for the tree displays.
+"""
+import random
+
+import pytest
+
+import nts.nts as nts
+
+
+def build(nodes):
+    """
+    Return a Tree with nodes, (nodeid, parent) pairs with the names taken
+    from the nodeids, added in the given order.
+    """
+    tree = nts.Tree()
+    for nodeid, parent in nodes:
+        tree.add(nodeid, nodeid, parent)
+    return tree
+
+
+def rendered(tree, nodeid='.', maxlevel=None):
+    return [f"{pre}{tree.names[pos]}" for pre, fill, pos in tree.render(nodeid, maxlevel)]
+
+
+# added out of order to check that the children are sorted
+nodes = [('.', None), ('b', '.'), ('a', '.'), ('c', '.'),
+        ('b2', 'b'), ('b1', 'b'), ('b11', 'b1'), ('b12', 'b1'),
+        ('a1', 'a'), ('c1', 'c'), ('c11', 'c1'), ('c2', 'c')]
+
+
+def test_render():
+    assert rendered(build(nodes)) == [
+        ".",
+        "├── a",
+        "│   └── a1",
+        "├── b",
+        "│   ├── b1",
+        "│   │   ├── b11",
+        "│   │   └── b12",
+        "│   └── b2",
+        "└── c",
+        "    ├── c1",
+        "    │   └── c11",
+        "    └── c2",
+        ]
+
+
+def test_render_fill():
+    tree = build(nodes)
+    fills = {tree.names[pos]: fill for pre, fill, pos in tree.render('.')}
+    # the fill continues the lines of the ancestors below a node
+    assert fills['.'] == ""
+    assert fills['b1'] == "│   │   "
+    assert fills['b2'] == "│       "
+    assert fills['c11'] == "    │       "
+    assert fills['c2'] == "        "
+
+
+def test_render_subtree_and_maxlevel():
+    tree = build(nodes)
+    assert rendered(tree, 'b') == ["b", "├── b1", "│   ├── b11", "│   └── b12", "└── b2"]
+    assert rendered(tree, '.', 2) == [".", "├── a", "├── b", "└── c"]
+    assert rendered(tree, 'c', 2) == ["c", "├── c1", "└── c2"]
+    assert rendered(tree, '.', 1) == ["."]
+
+
+def test_render_after_remove():
+    tree = build(nodes)
+    tree.remove('c')
+    tree.remove('b12')
+    # the freed positions are reused
+    tree.add('d', 'd', '.')
+    assert rendered(tree) == [
+        ".",
+        "├── a",
+        "│   └── a1",
+        "├── b",
+        "│   ├── b1",
+        "│   │   └── b11",
+        "│   └── b2",
+        "└── d",
+        ]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_same_as_anytree(seed):
+    anytree = pytest.importorskip('anytree')
+    rnd = random.Random(seed)
+    tree = nts.Tree()
+    tree.add('.', '.')
+    anynodes = {'.': anytree.Node('.')}
+    for i in range(40):
+        parent = rnd.choice(sorted(anynodes))
+        nodeid = f"{parent}/{i:02d}"
+        tree.add(nodeid, f"{i:02d}", parent)
+        anynodes[nodeid] = anytree.Node(f"{i:02d}", parent=anynodes[parent])
+    # RenderTree shows the children in the order added, which is sorted
+    # here since the names increase
+    expected = [f"{pre}{node.name}" for pre, fill, node in anytree.RenderTree(anynodes['.'])]
+    assert rendered(tree) == expected
+    expected = [f"{pre}{node.name}" for pre, fill, node in anytree.RenderTree(anynodes['.'], maxlevel=3)]
+    assert rendered(tree, '.', 3) == expected
@@ -0,0 +1,73 @@
+"""
+Checks that PollWatcher reports a burst of changes with a single call of
+the callback and asks for a full rescan when the directories change.
+"""
+import os
+import time
+
+import pytest
+
+from nts.watch import Watcher, PollWatcher
+
+
+def wait_for(calls, timeout=5):
+    end = time.monotonic() + timeout
+    while not calls and time.monotonic() < end:
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def watched(tmp_path):
+    for name in ['a.txt', 'b.txt', '.hidden.txt', 'c.md']:
+        (tmp_path / name).write_text("+ note\n")
+    calls = []
+    watcher = PollWatcher(str(tmp_path), calls.append, delay=0.2, interval=0.05)
+    watcher.start()
+    yield tmp_path, calls
+    watcher.stop()
+    watcher.thread.join(5)
+
+
+def append(path, text):
+    with open(path, 'a') as fo:
+        fo.write(text)
+
+
+def test_burst_is_one_call(watched):
+    tmp_path, calls = watched
+    # changes closer together than the delay, including files that are
+    # not note files
+    for i in range(8):
+        append(tmp_path / ('a.txt' if i % 2 else 'b.txt'), f"+ note {i}\n")
+        append(tmp_path / '.hidden.txt', "x\n")
+        append(tmp_path / 'c.md', "x\n")
+        time.sleep(0.05)
+    wait_for(calls)
+    time.sleep(0.5)
+    assert calls == [{str(tmp_path / 'a.txt'), str(tmp_path / 'b.txt')}]
+
+
+def test_removed_file(watched):
+    tmp_path, calls = watched
+    os.remove(tmp_path / 'a.txt')
+    wait_for(calls)
+    assert calls == [{str(tmp_path / 'a.txt')}]
+
+
+def test_directory_change_is_rescan(watched):
+    tmp_path, calls = watched
+    # pending files are replaced by a full rescan
+    append(tmp_path / 'a.txt', "+ another\n")
+    os.mkdir(tmp_path / 'new')
+    (tmp_path / 'new' / 'd.txt').write_text("+ new\n")
+    wait_for(calls)
+    time.sleep(0.5)
+    assert calls == [None]
+
+
+def test_wait_is_abstract():
+    class Incomplete(Watcher):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete('.', print)